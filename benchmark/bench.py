@@ -0,0 +1,241 @@
+'''
+Offline benchmarks on the recorded pages (see fixtures.py)
+
+    python benchmark/bench.py [-d benchmark/fixtures] [-parser lxml] [-latency 0.05] ...
+
+- hot paths: process_season_soup, process_team_page and uncomment_table on
+  every recorded page, in this process, in pages/sec
+- scrape: a full run against fixture_server.py, pages/sec, wall time per
+  stage (from the scraper's metrics), then the time of each dump_* exporter
+- peak RSS of this process and of the largest child process
+- the scraped tables compared with the golden output of the recording
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import bs4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the scraper modules
+import parsers
+from fetcher import FetchScheduler
+from fixture_server import FixtureServer
+from fixtures import DEFAULT_FIXTURES, compare_golden, export_golden, fixture_years, page_path
+from stat_schema import StatSchema
+import web_scraper
+from web_scraper import AsyncNFLSS, init_worker, process_season_soup, process_team_page
+
+try:
+    import resource
+except ImportError:  # windows, peak RSS isn't reported
+    resource = None
+
+
+EXPORT_STAGES = [
+    'dump_to_csv', 'dump_team_schedules', 'dump_stat_descriptions',
+    'dump_schema', 'dump_to_pickle', 'dump_to_parquet', 'dump_to_sqlite', 'dump_merged_games',
+]
+
+
+def read_pages(root: str, years: list[int]) -> tuple[list]:
+    ''' (year, html) season pages and (html, team_name, year) team pages, the pool tasks '''
+    parser = parsers.SoupParser('')  # no base url, the links are the pages' paths
+    seasons = []
+    teams = []
+    for year in years:
+        with open(page_path(root, f'/years/{year}/'), 'rb') as file:
+            html = file.read().decode('latin-1')
+        seasons.append((year, html))
+        for team_name, url in parser.parse_season_page(html)[1].items():
+            path = page_path(root, url)
+            if os.path.isfile(path):
+                with open(path, 'rb') as file:
+                    teams.append((file.read().decode('latin-1'), team_name, year))
+    return seasons, teams
+
+
+def commented_wrappers(parser, html: str) -> list:
+    ''' Table wrappers as uncomment_table gets them, still commented '''
+    if isinstance(parser, parsers.LxmlParser):
+        root = parsers.lxml.html.fromstring(html)
+        return [div for div in root.iter('div') if div.get('id') in parser.tables_to_extract]
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    wrappers = [soup.find('div', {'class': 'table_wrapper', 'id': table_id}) for table_id in parser.tables_to_extract]
+    return [wrapper for wrapper in wrappers if wrapper is not None]
+
+
+def best_time(function, tasks: list, repeat: int) -> dict:
+    ''' Best of repeat passes over tasks, each from a worker that hasn't described any table yet '''
+    times = []
+    for _ in range(repeat):
+        web_scraper.worker_schemas.clear()  # otherwise later passes skip the stat descriptions
+        start = time.perf_counter()
+        for task in tasks:
+            function(task)
+        times.append(time.perf_counter() - start)
+    seconds = min(times)
+    return {'pages': len(tasks), 'seconds': round(seconds, 4), 'pages_per_sec': round(len(tasks) / seconds, 1)}
+
+
+def bench_hot_paths(seasons: list, teams: list, parser_name: str, targeted: bool, repeat: int) -> dict:
+    parser = parsers.PARSERS[parser_name]('', targeted)
+    init_worker(parser, StatSchema())  # the pool workers' globals, in this process
+    results = {
+        'process_season_soup': best_time(process_season_soup, seasons, repeat),
+        'process_team_page': best_time(process_team_page, teams, repeat),
+    }
+
+    # uncomment_table changes the wrappers, every pass gets new ones (not timed)
+    times = []
+    for _ in range(repeat):
+        wrappers = [wrapper for year, html in seasons for wrapper in commented_wrappers(parser, html)]
+        start = time.perf_counter()
+        for wrapper in wrappers:
+            parser.uncomment_table(wrapper)
+        times.append(time.perf_counter() - start)
+    results['uncomment_table'] = {
+        'pages': len(seasons), 'tables': len(wrappers), 'seconds': round(min(times), 4),
+        'pages_per_sec': round(len(seasons) / min(times), 1),
+    }
+    return results
+
+
+def timed(owner, name: str, timings: dict):
+    ''' Replaces owner.name with a wrapper adding its wall time to timings[name] '''
+    method = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings[name] = round(timings.get(name, 0) + time.perf_counter() - start, 4)
+    setattr(owner, name, wrapper)
+
+
+def bench_scrape(root: str, years: list[int], options: dict, latency: float, jitter: float, workdir: str) -> dict:
+    ''' Full scrape and export against the stand-in server, from workdir '''
+    exports = {}
+    with FixtureServer(root, latency, jitter) as server:
+        scraper = AsyncNFLSS(
+            years[0], years[-1], True, True, True, True,
+            export_parquet=web_scraper.pa is not None, export_sqlite=True, export_merge=True,
+            base_url=server.base_url, fetcher=FetchScheduler(max_rate=1000, per_host=100, connections=100),
+            **options
+        )
+        for name in EXPORT_STAGES:
+            timed(scraper, name, exports)
+
+        start = time.perf_counter()
+        scraper.run()
+        seconds = time.perf_counter() - start
+        scraper.export()
+        pages = server.hits.value
+
+    export_golden(scraper, os.path.join(workdir, 'output'))
+    records = scraper.metrics.records()
+    stages = {
+        record['labels']['stage']: round(record['value'], 4)
+        for record in records if record['metric'] == 'stage_seconds'
+    }
+    return {
+        'pages': pages,
+        'seconds': round(seconds, 4),
+        'pages_per_sec': round(pages / seconds, 1),
+        'failed_pages': len(scraper.failed_pages),
+        'stages': stages,
+        'exports': exports,
+        'metrics': records,
+    }
+
+
+def peak_rss_mb() -> dict:
+    if resource is None:
+        return {}
+    # ru_maxrss is in KB on linux, bytes on macos; children = the largest child (pool worker or server)
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return {
+        'main': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'workers': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def print_report(report: dict):
+    for name, result in report['hot_paths'].items():
+        print(f'{name:<30}{result["pages_per_sec"]:>10} pages/s  ({result["pages"]} pages in {result["seconds"]}s)')
+
+    scrape = report['scrape']
+    print(f'{"scrape":<30}{scrape["pages_per_sec"]:>10} pages/s  ({scrape["pages"]} pages in {scrape["seconds"]}s)')
+    for name, seconds in list(scrape['stages'].items()) + list(scrape['exports'].items()):
+        print(f'\t{name:<30}{seconds:>8}s')
+    if scrape['failed_pages']:
+        print(f'\t{scrape["failed_pages"]} pages failed')
+
+    for process, megabytes in report['peak_rss_mb'].items():
+        print(f'{"peak RSS " + process:<30}{megabytes:>10} MB')
+
+    if report['golden'] is None:
+        print('No golden output to compare with')
+    elif report['golden']:
+        print('Output differs from the golden output:')
+        for difference in report['golden']:
+            print('\t' + difference)
+    else:
+        print('Output matches the golden output')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the scraper on the recorded pages')
+    parser.add_argument('-d', default=DEFAULT_FIXTURES, help='Fixtures directory (default = benchmark/fixtures)')
+    parser.add_argument('-parser', choices=list(parsers.PARSERS), default='bs4', help='HTML parser (default = bs4)')
+    parser.add_argument('-targeted', action='store_true', help='Only parse the wanted tables')
+    parser.add_argument('-stream', action='store_true', help='Scrape with -stream')
+    parser.add_argument('-lowmem', action='store_true', help='Scrape with -lowmem')
+    parser.add_argument('-executor', action='store_true', help='Scrape with -executor')
+    parser.add_argument('-w', type=int, help='How many workers to use (default = cpu_count)')
+    parser.add_argument('-latency', type=float, default=0.0, help='Server latency per page, in seconds (default = 0)')
+    parser.add_argument('-jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('-repeat', type=int, default=3, help='Hot path passes, the best one is reported (default = 3)')
+    parser.add_argument('-update_golden', action='store_true', help='Replace the golden output with this run')
+    parser.add_argument('-json', help='Also write the report to this file, e.g. to compare runs')
+    args = vars(parser.parse_args())
+
+    root = os.path.abspath(args['d'])
+    years = fixture_years(root)
+    if not years:
+        sys.exit(f'No recorded pages in {root}, record some with: python benchmark/fixtures.py 2019 2021')
+
+    seasons, teams = read_pages(root, years)
+    report = {'years': [years[0], years[-1]], 'options': args}
+    report['hot_paths'] = bench_hot_paths(seasons, teams, args['parser'], args['targeted'], args['repeat'])
+    del seasons, teams
+
+    options = dict(
+        parser=args['parser'], targeted=args['targeted'],
+        stream=args['stream'], low_memory=args['lowmem'], use_executor=args['executor'], max_workers=args['w']
+    )
+    workdir = tempfile.mkdtemp(prefix='nfl_bench_')
+    cwd = os.getcwd()
+    os.chdir(workdir)  # the scraper exports to ./data
+    try:
+        report['scrape'] = bench_scrape(root, years, options, args['latency'], args['jitter'], workdir)
+        report['peak_rss_mb'] = peak_rss_mb()
+
+        golden_dir = os.path.join(root, 'golden')
+        if args['update_golden']:
+            shutil.rmtree(golden_dir, ignore_errors=True)
+            shutil.copytree(os.path.join(workdir, 'output'), golden_dir)
+        report['golden'] = compare_golden(golden_dir, 'output') if os.path.isdir(golden_dir) else None
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args['json']:
+        with open(args['json'], 'w') as file:
+            json.dump(report, file, indent=1)
+    if report['golden']:
+        sys.exit(1)
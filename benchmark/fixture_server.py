@@ -0,0 +1,102 @@
+'''
+Local stand-in for the site: serves the recorded pages with a configurable latency
+
+    python benchmark/fixture_server.py [-d benchmark/fixtures] [-port 8765] [-latency 0.05]
+
+then point the scraper at it with AsyncNFLSS(..., base_url='http://127.0.0.1:8765').
+'''
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+from aiohttp import web
+from fixtures import DEFAULT_FIXTURES, page_path
+
+
+def make_app(root: str, latency: float = 0.0, jitter: float = 0.0, hits=None) -> web.Application:
+    ''' Every request waits latency (+ up to jitter) seconds, pages that weren't recorded are 404s '''
+
+    async def serve_page(request):
+        delay = latency + random.uniform(0, jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        path = page_path(root, request.path)
+        if not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        with open(path, 'rb') as file:
+            body = file.read()
+        if hits is not None:
+            with hits.get_lock():
+                hits.value += 1
+        return web.Response(body=body, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/{path:.*}', serve_page)
+    return app
+
+
+def serve(root: str, latency: float, jitter: float, port: int, hits=None, ready=None):
+    async def main():
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', port))  # port 0 = any free port, sent back through ready
+        runner = web.AppRunner(make_app(root, latency, jitter, hits), access_log=None)
+        await runner.setup()
+        await web.SockSite(runner, sock).start()
+        if ready is not None:
+            ready.put(sock.getsockname()[1])
+        else:
+            print(f'Serving {root} on http://127.0.0.1:{sock.getsockname()[1]}')
+        await asyncio.Event().wait()  # until the process is stopped
+
+    asyncio.run(main())
+
+
+class FixtureServer:
+    ''' Runs the stand-in in its own process, it doesn't compete with the scraper's event loop '''
+
+    def __init__(self, root: str = DEFAULT_FIXTURES, latency: float = 0.0, jitter: float = 0.0, port: int = 0):
+        self.root = root
+        self.latency = latency
+        self.jitter = jitter
+        self.port = port
+        self.hits = multiprocessing.Value('i', 0)  # pages served
+        self.process = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve, args=(self.root, self.latency, self.jitter, self.port, self.hits, ready), daemon=True
+        )
+        self.process.start()
+        self.port = ready.get(timeout=30)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the recorded pages like the site would')
+    parser.add_argument('-d', default=DEFAULT_FIXTURES, help='Fixtures directory (default = benchmark/fixtures)')
+    parser.add_argument('-port', type=int, default=8765, help='Port (default = 8765)')
+    parser.add_argument('-latency', type=float, default=0.0, help='Seconds before each response (default = 0)')
+    parser.add_argument('-jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    args = vars(parser.parse_args())
+
+    serve(args['d'], args['latency'], args['jitter'], args['port'])
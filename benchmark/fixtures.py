@@ -0,0 +1,110 @@
+'''
+Recorded season and team pages for the benchmarks, stored like the site's URLs
+
+    python benchmark/fixtures.py 2019 2021 [-d benchmark/fixtures]
+
+scrapes the live site once, keeps every page under the fixtures directory and
+writes the golden output (what the scraper exported from those pages) to
+fixtures/golden, bench.py then only needs the recorded pages.
+'''
+import argparse
+import glob
+import os
+import sys
+from urllib.parse import urlparse
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the scraper modules
+from fetcher import FetchScheduler
+from web_scraper import AsyncNFLSS
+
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+GOLDEN_FILES = {  # file name: key columns the rows are sorted by before comparing
+    'season.csv': ['year', 'team'],
+    'team_schedule.csv': ['year', 'team', 'week_number'],
+}
+
+
+def page_path(root: str, url_path: str) -> str:
+    ''' /years/2015/ -> root/years/2015/index.html, /teams/kan/2015.htm -> root/teams/kan/2015.htm '''
+    parts = [part for part in url_path.split('/') if part and part not in ('.', '..')]
+    if url_path.endswith('/') or not parts:
+        parts.append('index.html')
+    return os.path.join(root, *parts)
+
+
+def fixture_years(root: str) -> list[int]:
+    years = [os.path.basename(path) for path in glob.glob(os.path.join(root, 'years', '*'))]
+    return sorted(int(year) for year in years if year.isdigit())
+
+
+class RecordingScraper(AsyncNFLSS):
+    ''' Scrapes the site as usual, keeping a copy of every page it fetches '''
+
+    def __init__(self, *args, fixtures_dir: str = DEFAULT_FIXTURES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fixtures_dir = fixtures_dir
+
+    async def fetch_page(self, url, year):
+        html, from_cache = await super().fetch_page(url, year)
+        path = page_path(self.fixtures_dir, urlparse(url).path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(html.encode(self.encoding))  # the bytes the server sent
+        return html, from_cache
+
+
+def export_golden(scraper: AsyncNFLSS, directory: str):
+    ''' Writes the scraped tables the way the golden output is compared '''
+    os.makedirs(directory, exist_ok=True)
+    scraper.season_data.to_frame().to_csv(os.path.join(directory, 'season.csv'), sep=';', index=False)
+    scraper.team_schedules.to_frame().to_csv(os.path.join(directory, 'team_schedule.csv'), sep=';', index=False)
+    with open(os.path.join(directory, 'stat_descriptions.txt'), 'w', encoding='utf-8') as file:
+        file.writelines(f'{row!r}\n' for row in sorted(set(scraper.stat_descriptions)))
+
+
+def compare_golden(golden_dir: str, output_dir: str) -> list[str]:
+    ''' Differences between two export_golden outputs, row order doesn't matter '''
+    differences = []
+    for filename, keys in GOLDEN_FILES.items():
+        expected = pd.read_csv(os.path.join(golden_dir, filename), sep=';')
+        actual = pd.read_csv(os.path.join(output_dir, filename), sep=';')
+        expected = expected.sort_values(keys).reset_index(drop=True)
+        actual = actual.sort_values(keys).reset_index(drop=True)
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+        except AssertionError as error:
+            differences.append(f'{filename}: {error}')
+
+    with open(os.path.join(golden_dir, 'stat_descriptions.txt'), encoding='utf-8') as file:
+        expected = file.read()
+    with open(os.path.join(output_dir, 'stat_descriptions.txt'), encoding='utf-8') as file:
+        if file.read() != expected:
+            differences.append('stat_descriptions.txt: stat names, labels or tips differ')
+    return differences
+
+
+def record_fixtures(start_year: int, end_year: int, fixtures_dir: str = DEFAULT_FIXTURES, rate: float = 2):
+    ''' Records the pages of start_year..end_year and their golden output '''
+    scraper = RecordingScraper(
+        start_year, end_year, False, False, False, False,
+        fetcher=FetchScheduler(max_rate=rate), fixtures_dir=fixtures_dir
+    )
+    scraper.run()
+    if scraper.failed_pages:
+        raise RuntimeError(f'{len(scraper.failed_pages)} pages could not be recorded, run again')
+    export_golden(scraper, os.path.join(fixtures_dir, 'golden'))
+    scraper.journal.remove()
+    print(f'Recorded {start_year}-{end_year} to {fixtures_dir}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record season and team pages for the benchmarks')
+    parser.add_argument('start_year', type=int, help='Initial year')
+    parser.add_argument('end_year', type=int, help='End year')
+    parser.add_argument('-d', default=DEFAULT_FIXTURES, help='Fixtures directory (default = benchmark/fixtures)')
+    parser.add_argument('-rate', type=float, default=2, help='Max requests per second (default = 2)')
+    args = vars(parser.parse_args())
+
+    record_fixtures(args['start_year'], args['end_year'], args['d'], args['rate'])
@@ -0,0 +1,84 @@
+'''
+Checkpoint journal, parsed pages are saved as they complete so -resume can pick them up
+'''
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+
+
+class CheckpointJournal:
+    ''' Append-only SQLite journal of parsed season and team pages
+
+    Every parsed page is committed as soon as its result arrives, a crashed
+    run loses at most the pages that were in flight. Entries written by another
+    parser version are ignored.
+    '''
+
+    def __init__(self, path: str, version: int):
+        self.path = path
+        self.version = version
+        self.connection = None
+
+    def read(self) -> list[tuple]:
+        ''' (kind, year, team, result) of every completed page, in completion order '''
+        if not os.path.exists(self.path):
+            return []
+        connection = sqlite3.connect(self.path)
+        try:
+            rows = connection.execute(
+                'SELECT kind, year, team, payload FROM pages WHERE version = ? ORDER BY id',
+                (self.version,)
+            ).fetchall()
+        except sqlite3.DatabaseError:  # unfinished or corrupted journal, start over
+            return []
+        finally:
+            connection.close()
+        return [
+            (kind, year, team, pickle.loads(zlib.decompress(payload)))
+            for kind, year, team, payload in rows
+        ]
+
+    def start(self, resume: bool):
+        ''' Opens the journal for writing, without resume any previous entries are dropped '''
+        if not resume:
+            self.remove()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')  # survives crashes of the scraper
+        self.connection.execute(
+            '''CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                team TEXT,
+                version INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                completed_at REAL NOT NULL
+            )'''
+        )
+        self.connection.commit()
+
+    def add(self, kind: str, year: int, team: str, result):
+        if self.connection is None:
+            return
+        payload = zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        self.connection.execute(
+            'INSERT INTO pages (kind, year, team, version, payload, completed_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, year, team, self.version, payload, time.time())
+        )
+        self.connection.commit()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def remove(self):
+        ''' Deletes the journal, once the run it covers has been exported '''
+        self.close()
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
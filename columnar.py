@@ -0,0 +1,362 @@
+'''
+Typed, append-only column store for scraped rows
+'''
+import array
+import re
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+
+INT_PATTERN = re.compile(r'[+-]?\d+')
+FLOAT_PATTERN = re.compile(r'[+-]?(?:\d+\.\d*|\.\d+)')
+KIND_ORDER = {None: 0, 'bool': 1, 'int': 2, 'float': 3, 'str': 4}
+
+
+def parse_value(text: str):
+    ''' '' -> None, numbers -> int or float, anything else stays a str '''
+    if text == '':
+        return None
+    if INT_PATTERN.fullmatch(text):
+        return int(text)
+    if FLOAT_PATTERN.fullmatch(text):
+        return float(text)
+    return text
+
+
+def kind_of(value) -> str:
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'str'
+
+
+def convert_exported_row(row: dict, convert) -> dict:
+    ''' Stats of an untyped export through convert(stat_name, text), missing values as empty cells
+
+    Separator rows (e.g. `Playoffs`) have a single cell, their other stats
+    weren't empty cells but absent and stay missing.
+    '''
+    present = sum(value is not None for value in row.values())
+    return {
+        name: convert(name, str(value)) if value is not None
+        else (convert(name, '') if present > 1 else None)
+        for name, value in row.items()
+    }
+
+
+class Column:
+    ''' One column, stored as bool / int64 / float64 arrays or a list of str
+
+    The column starts untyped and is widened (bool -> int -> float -> str) when
+    a value doesn't fit, missing values are tracked in a validity mask.
+    '''
+
+    def __init__(self, length: int = 0):
+        self.kind = None
+        self.values = None
+        self.valid = bytearray(length)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def promote(self, kind: str):
+        if KIND_ORDER[kind] <= KIND_ORDER[self.kind]:
+            return
+
+        if kind == 'bool':
+            self.values = array.array('b', bytes(len(self.valid)))
+        elif kind == 'int':
+            if self.kind == 'bool':
+                self.values = array.array('q', self.values)
+            else:
+                self.values = array.array('q', bytes(8 * len(self.valid)))
+        elif kind == 'float':
+            old_values = self.values or [0] * len(self.valid)
+            self.values = array.array('d', (
+                float(value) if valid else np.nan
+                for value, valid in zip(old_values, self.valid)
+            ))
+        else:  # str, numbers already stored lose their original formatting
+            old_values = self.to_list()
+            self.values = [
+                str(value) if valid else None
+                for value, valid in zip(old_values, self.valid)
+            ]
+        self.kind = kind
+
+    def append(self, value):
+        ''' Appends an already converted value, None for missing '''
+        if value is None:
+            self.valid.append(0)
+            if self.kind in ('bool', 'int'):
+                self.values.append(0)
+            elif self.kind == 'float':
+                self.values.append(np.nan)
+            elif self.kind == 'str':
+                self.values.append(None)
+            return
+
+        self.promote(kind_of(value))
+        if self.kind == 'int':
+            value = int(value)
+        elif self.kind == 'float':
+            value = float(value)
+        elif self.kind == 'str':
+            value = str(value)
+        self.values.append(value)
+        self.valid.append(1)
+
+    def append_text(self, text: str):
+        ''' Appends a scraped cell, converted once here '''
+        if self.kind == 'str' and text != '':
+            self.values.append(text)  # keeps the original text
+            self.valid.append(1)
+        else:
+            self.append(parse_value(text))
+
+    def to_list(self) -> list:
+        ''' Python values, None for missing '''
+        if self.kind is None:
+            return [None] * len(self.valid)
+        if self.kind == 'bool':
+            return [bool(value) if valid else None for value, valid in zip(self.values, self.valid)]
+        return [
+            value if valid else None
+            for value, valid in zip(self.values, self.valid)
+        ]
+
+    def truncate(self, length: int):
+        del self.valid[length:]
+        if self.values is not None:
+            del self.values[length:]
+
+    def to_array(self):
+        ''' numpy/pandas array of a copy of the column buffers
+
+        A view would export the array.array buffers, and appending to the
+        column while the frame is alive would raise BufferError.
+        '''
+        if self.kind is None:
+            return np.full(len(self.valid), None, dtype=object)
+
+        if self.kind == 'str':
+            return np.array(self.values, dtype=object)
+
+        if self.kind == 'bool':
+            values = np.frombuffer(self.values, dtype=np.int8).astype(bool)  # astype copies
+            mask = np.frombuffer(self.valid, dtype=np.uint8) == 0
+            return pd.arrays.BooleanArray(values, mask) if mask.any() else values
+
+        dtype = np.int64 if self.kind == 'int' else np.float64
+        values = np.frombuffer(self.values, dtype=dtype).copy()
+        if self.kind == 'float' or all(self.valid):
+            return values
+        mask = np.frombuffer(self.valid, dtype=np.uint8) == 0
+        return pd.arrays.IntegerArray(values, mask)
+
+
+class CategoryColumn:
+    ''' Repeated strings (team names, W/L...) stored as int32 codes into a list of categories '''
+
+    kind = 'category'
+
+    def __init__(self, length: int = 0):
+        self.codes = array.array('i', [-1]) * length
+        self.categories = []
+        self.category_codes = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        value = str(value)
+        code = self.category_codes.get(value)
+        if code is None:
+            code = self.category_codes[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes.append(code)
+
+    def append_text(self, text: str):
+        self.append(text if text != '' else None)
+
+    def to_list(self) -> list:
+        return [self.categories[code] if code >= 0 else None for code in self.codes]
+
+    def truncate(self, length: int):
+        del self.codes[length:]
+
+    def to_array(self):
+        codes = np.frombuffer(self.codes, dtype=np.int32).copy()
+        return pd.Categorical.from_codes(codes, self.categories)
+
+
+class ColumnarTable:
+    ''' Rows identified by key columns (e.g. year, team) plus any number of stats
+
+    Stats are appended as scraped text and converted on ingest, or already
+    typed (see stat_schema), columns seen for the first time are backfilled
+    with missing values. With a schema, category stats are dictionary encoded.
+    '''
+
+    def __init__(self, key_names: list[str], schema=None):
+        self.key_names = key_names
+        self.schema = schema
+        self.keys = {name: self.new_column(name) for name in key_names}
+        self.columns = {}
+        self.length = 0
+
+    def new_column(self, name: str, length: int = 0):
+        if self.schema is not None and self.schema.type_of(name) == 'category':
+            return CategoryColumn(length)
+        return Column(length)
+
+    def column_types(self) -> dict:
+        ''' Stored type by column name, the type of repeated names is the first column's '''
+        types = {}
+        for name, column in list(self.keys.items()) + list(self.columns.items()):
+            types.setdefault(name, column.kind or 'str')
+        return types
+
+    def __len__(self):
+        return self.length
+
+    @contextmanager
+    def appending(self, count: int):
+        ''' Adds count rows, or none: a failed append cuts every column back to the table's length '''
+        column_count = len(self.columns)
+        try:
+            yield
+            for column in self.columns.values():
+                for _ in range(self.length + count - len(column)):  # stats missing from these rows
+                    column.append(None)
+        except BaseException:
+            for stat_name in list(self.columns)[column_count:]:  # added by the failed rows
+                del self.columns[stat_name]
+            for column in list(self.keys.values()) + list(self.columns.values()):
+                column.truncate(self.length)
+            assert self.consistent(), 'columns out of line after a failed append'
+            raise
+        self.length += count
+
+    def consistent(self) -> bool:
+        ''' Every key and stat column holds exactly length values '''
+        return all(len(column) == self.length for column in list(self.keys.values()) + list(self.columns.values()))
+
+    def append(self, keys: tuple, row: dict):
+        with self.appending(1):
+            for name, value in zip(self.key_names, keys):
+                self.keys[name].append(value)
+
+            for stat_name, text in row.items():
+                column = self.columns.get(stat_name)
+                if column is None:
+                    column = self.columns[stat_name] = self.new_column(stat_name, self.length)
+                column.append_text(text)
+
+    def extend_frame(self, df: pd.DataFrame, convert=None):
+        ''' Appends the rows of a DataFrame exported from a table like this one
+
+        The first column named after each key is the key, the others are stats,
+        `team.1` style names (see column_names) get their original name back.
+        Stats of untyped exports can go through convert(stat_name, text), like
+        scraped cells ('' for missing values).
+        '''
+        keys = {}
+        stats = []
+        for position, name in enumerate(df.columns):
+            values = [
+                None if pd.isna(value) else value
+                for value in df.iloc[:, position].astype(object).tolist()
+            ]
+            if name in self.key_names and name not in keys:
+                keys[name] = values
+                continue
+            base_name, _, suffix = name.rpartition('.')
+            if base_name in self.key_names and suffix.isdigit():
+                name = base_name
+            stats.append((name, values))
+
+        key_columns = [keys[name] for name in self.key_names]
+        for irow in range(len(df)):
+            row_keys = tuple(values[irow] for values in key_columns)
+            row = {name: values[irow] for name, values in stats}
+            if convert is not None:
+                row = convert_exported_row(row, convert)
+            self.append_values(row_keys, row)
+
+    def append_values(self, keys: tuple, row: dict):
+        ''' Like append, for rows that are already typed '''
+        with self.appending(1):
+            for name, value in zip(self.key_names, keys):
+                self.keys[name].append(value)
+
+            for stat_name, value in row.items():
+                column = self.columns.get(stat_name)
+                if column is None:
+                    column = self.columns[stat_name] = self.new_column(stat_name, self.length)
+                column.append(value)
+
+    def extend_batch(self, keys: tuple, batch):
+        ''' Appends a page's RowBatch (see records.py), keys come before each row's own key '''
+        count = len(batch)
+        with self.appending(count):
+            for name, value in zip(self.key_names, keys):
+                column = self.keys[name]
+                for _ in range(count):
+                    column.append(value)
+            row_keys = self.keys[self.key_names[len(keys)]]
+            for value in batch.keys:
+                row_keys.append(value)
+
+            for stat_name, values in zip(batch.names, batch.columns):
+                column = self.columns.get(stat_name)
+                if column is None:
+                    column = self.columns[stat_name] = self.new_column(stat_name, self.length)
+                for value in values:
+                    column.append(value)
+
+    def column_names(self, unique: bool = False) -> list[str]:
+        names = self.key_names + list(self.columns)
+        if not unique:
+            return names
+
+        # repeated names get a suffix, like pandas.read_csv does (team, team.1)
+        seen = {}
+        unique_names = []
+        for name in names:
+            count = seen.get(name, 0)
+            unique_names.append(name if count == 0 else f'{name}.{count}')
+            seen[name] = count + 1
+        return unique_names
+
+    def to_frame(self, unique_names: bool = False) -> pd.DataFrame:
+        ''' DataFrame with the key columns first, the table can still grow afterwards
+
+        Stat names may repeat key names (e.g. `team`), like the old exports,
+        unless unique_names is set.
+        '''
+        names = self.column_names(unique_names)
+        arrays = [column.to_array() for column in self.keys.values()]
+        arrays += [column.to_array() for column in self.columns.values()]
+        df = pd.DataFrame(dict(enumerate(arrays)), copy=False)
+        df.columns = names
+        return df
+
+    def to_nested(self) -> dict:
+        ''' {key_0: {key_1: ... {stat: value}}}, the layout of the old exports '''
+        nested = {}
+        keys = [column.to_list() for column in self.keys.values()]
+        stats = {name: column.to_list() for name, column in self.columns.items()}
+        for irow in range(self.length):
+            level = nested
+            for key in keys[:-1]:
+                level = level.setdefault(key[irow], {})
+            level[keys[-1][irow]] = {name: values[irow] for name, values in stats.items()}
+        return nested
@@ -0,0 +1,224 @@
+'''
+Rate limited HTTP client with retries for the async scraper
+'''
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from multidict import CIMultiDict
+from metrics import Metrics
+
+try:
+    import brotli  # optional, aiohttp decodes br responses when it is installed
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+log = logging.getLogger('nflss.fetcher')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+
+class FetchResult(NamedTuple):
+    status: int
+    headers: CIMultiDict
+    body: bytes
+
+
+class FetchError(Exception):
+    ''' A request that still failed after every retry '''
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f'{url}: {reason}')
+        self.url = url
+        self.reason = reason
+
+
+def parse_retry_after(value: str) -> float:
+    ''' Seconds to wait from a Retry-After header (delay or HTTP date) '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class HostLimiter:
+    ''' Token bucket plus a concurrency cap for a single host
+
+    The rate adapts AIMD style: it is halved when the host throttles us
+    (429/503) and creeps back up to max_rate with every success. Only requests
+    sent at the current rate can lower it again, a burst of 429s for requests
+    already in flight halves it once.
+    '''
+
+    def __init__(self, max_rate: float, concurrency: int, min_rate: float = 0.2):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.throttled_at = 0.0
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.slots = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        ''' Waits for a token, requests leave in arrival order. Returns the send time '''
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return now
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def throttled(self, sent_at: float, retry_after: float = None):
+        now = time.monotonic()
+        if sent_at >= self.throttled_at:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.throttled_at = now
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class FetchScheduler:
+    ''' One HTTP session for a whole run, GET requests go through per-host limiters
+
+    The session keeps connections alive and caches DNS lookups between
+    requests, use it as `async with scheduler:` around everything it fetches.
+    Failed requests are retried with exponential backoff and full jitter,
+    honoring Retry-After. A request that runs out of retries raises FetchError
+    without touching any other request.
+    '''
+
+    def __init__(
+        self, max_rate: float = 10.0, per_host: int = 10,
+        retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+        connections: int = 10, compress: bool = True, dns_ttl: int = 600,
+        metrics: Metrics = None
+    ):
+        self.max_rate = max_rate
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connections = connections
+        self.compress = compress
+        self.dns_ttl = dns_ttl
+
+        self.session = None
+        self.limiters = {}
+        self.rates = {}  # learned rate by host, outlives the session
+        self.retry_count = 0
+        self.in_flight = 0
+        # request_seconds / requests / response_bytes / wire_bytes / retries / fetch_failures
+        self.metrics = metrics or Metrics()
+
+    async def open(self):
+        if self.session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.connections,  # avoid spamming the target
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=30
+        )
+        headers = {'Accept-Encoding': ACCEPT_ENCODING if self.compress else 'identity'}
+        self.session = aiohttp.ClientSession(connector=connector, headers=headers)
+
+    async def close(self):
+        if self.session is None:
+            return
+        await self.session.close()
+        self.session = None
+        # asyncio primitives belong to the loop that used them
+        self.rates.update((host, limiter.rate) for host, limiter in self.limiters.items())
+        self.limiters = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def get_limiter(self, url: str) -> HostLimiter:
+        host = urlsplit(url).netloc
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            limiter = self.limiters[host] = HostLimiter(self.max_rate, self.per_host)
+            limiter.rate = self.rates.get(host, limiter.rate)
+        return limiter
+
+    def backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def fetch(self, url: str, headers: dict = None) -> FetchResult:
+        limiter = self.get_limiter(url)
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            async with limiter.slots:
+                sent_at = await limiter.acquire()
+                self.in_flight += 1
+                self.metrics.set_gauge('requests_in_flight', self.in_flight)
+                try:
+                    async with self.session.get(url, headers=headers) as r:
+                        self.metrics.count('requests', status=str(r.status))
+                        if r.status in RETRY_STATUSES:
+                            reason = f'HTTP {r.status}'
+                            retry_after = parse_retry_after(r.headers.get('Retry-After'))
+                            if r.status in THROTTLE_STATUSES:
+                                limiter.throttled(sent_at, retry_after)
+                        else:
+                            r.raise_for_status()  # other 4xx won't get better with retries
+                            body = await r.read()
+                            limiter.succeeded()
+                            self.record_response(sent_at, r, body)
+                            return FetchResult(r.status, CIMultiDict(r.headers), body)  # ETag / Etag alike
+                except aiohttp.ClientResponseError as error:
+                    self.metrics.count('fetch_failures', reason=f'HTTP {error.status}')
+                    raise FetchError(url, f'HTTP {error.status}') from error
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    reason = repr(error)
+                    self.metrics.count('requests', status='error')
+                finally:
+                    self.in_flight -= 1
+                    self.metrics.set_gauge('requests_in_flight', self.in_flight)
+
+            if attempt == self.retries:
+                break
+            self.retry_count += 1
+            self.metrics.count('retries', reason=reason.split('(')[0])
+            delay = retry_after if retry_after is not None else self.backoff_delay(attempt)
+            log.info(f'\tRetrying {url} in {delay:.1f}s ({reason})')
+            await asyncio.sleep(delay)
+
+        self.metrics.count('fetch_failures', reason=reason.split('(')[0])
+        raise FetchError(url, reason)
+
+    def record_response(self, sent_at: float, response, body: bytes):
+        # latency from when the request was let through the limiter to the whole body
+        self.metrics.observe('request_seconds', time.monotonic() - sent_at)
+        self.metrics.count('response_bytes', len(body))
+        # compressed size when the server sent it, decoded size otherwise
+        self.metrics.count('wire_bytes', int(response.headers.get('Content-Length', len(body))))
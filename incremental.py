@@ -0,0 +1,106 @@
+'''
+Incremental scraping: reuse a previous export, only scrape what it is missing
+'''
+import csv
+import glob
+import json
+import os
+import re
+import time
+import pandas as pd
+from stat_schema import read_dtypes
+
+
+EXPORT_PATTERN = re.compile(r'\d{4}-\d{4}')
+
+
+def find_previous_export(data_dir: str = 'data') -> str:
+    ''' Export prefix (e.g. data/1970-2020) of the newest season data in data_dir '''
+    candidates = []
+    for path in glob.glob(os.path.join(data_dir, '*')):
+        prefix, extension = os.path.splitext(path)
+        if extension in ('.csv', '.parquet') and EXPORT_PATTERN.fullmatch(os.path.basename(prefix)):
+            candidates.append((os.path.getmtime(path), prefix))
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+def integral_floats_to_int(df: pd.DataFrame) -> pd.DataFrame:
+    # CSV readers turn int columns with blanks into floats
+    for name in df.columns:
+        if df[name].dtype.kind == 'f' and ((df[name].dropna() % 1) == 0).all():
+            df[name] = df[name].astype('Int64')
+    return df
+
+
+def read_export(prefix: str, suffix: str = '') -> pd.DataFrame:
+    ''' Reads prefix + suffix as Parquet if it was exported, else as CSV '''
+    parquet_path = prefix + suffix + '.parquet'
+    if os.path.exists(parquet_path):
+        df = pd.read_parquet(parquet_path)
+        df['year'] = df['year'].astype(int)  # partition column comes back as a category
+        return df
+
+    csv_path = prefix + suffix + '.csv'
+    if os.path.exists(csv_path):
+        # typed like the scraped tables when the export has a schema, inferred otherwise
+        columns = pd.read_csv(csv_path, sep=';', index_col=0, nrows=0).columns
+        dtypes = {name: dtype for name, dtype in read_dtypes(prefix + '_schema.json').items() if name in columns}
+        df = pd.read_csv(csv_path, sep=';', index_col=0, dtype=dtypes)
+        return integral_floats_to_int(df)
+    return None
+
+
+def read_stat_descriptions(prefix: str) -> list[tuple[str]]:
+    try:
+        with open(prefix + '_stat_descriptions.csv', newline='') as file:
+            rows = list(csv.reader(file))
+    except FileNotFoundError:
+        return []
+    return [tuple(row) for row in rows[1:] if row]  # skips the header
+
+
+def read_manifest(prefix: str) -> dict:
+    try:
+        with open(prefix + '_manifest.json') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'years': {}}
+
+
+def write_manifest(prefix: str, years: dict):
+    with open(prefix + '_manifest.json', 'w') as file:
+        json.dump({'created_at': time.time(), 'years': years}, file, indent=1, sort_keys=True)
+
+
+def plan_scrape(years, season_df, schedule_df, manifest: dict, is_final_season) -> dict:
+    ''' Which teams to skip per year that still has to be scraped
+
+    Years left out of the plan are complete in the previous export. A year with
+    an empty set is scraped from scratch, otherwise its season page is scraped
+    again (for the team links) but the listed teams' pages are skipped.
+    '''
+    plan = {}
+    for year in years:
+        season_teams = set()
+        if season_df is not None:
+            season_teams = set(season_df.loc[season_df['year'] == year, 'team'])
+        if not season_teams:  # never scraped
+            plan[year] = set()
+            continue
+
+        info = manifest['years'].get(str(year))
+        was_final = info['final'] if info else is_final_season(year)
+        if not was_final:  # scraped while the season was still going
+            plan[year] = set()
+            continue
+
+        scraped_teams = set()
+        if schedule_df is not None:
+            scraped_teams = set(schedule_df.loc[schedule_df['year'] == year, 'team'])
+        expected_teams = set(info['teams']) if info else season_teams
+        if not expected_teams <= scraped_teams:  # some team pages are missing
+            plan[year] = scraped_teams
+
+    return plan
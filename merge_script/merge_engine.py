@@ -0,0 +1,179 @@
+'''
+Merging the team schedules with the season stats
+'''
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+
+log = logging.getLogger('nflss')  # the scraper's logger, -log sets the level
+
+# prefixes of the merged columns
+GAME_PREFIX = 'gs_'  # game_stat_
+HOME_PREFIX = 'hts_'  # home_team_stat_
+AWAY_PREFIX = 'ats_'  # away_team_stat_
+
+KAGGLE_TEST_YEARS = [2018, 2019, 2020, 2021]
+KAGGLE_DROPPED_COLUMNS = [
+    'gs_overtime', 'gs_pts_off', 'gs_pts_def',
+    'gs_first_down_off', 'gs_yards_off', 'gs_pass_yds_off',
+    'gs_rush_yds_off', 'gs_to_off', 'gs_first_down_def',
+    'gs_yards_def', 'gs_pass_yds_def', 'gs_rush_yds_def',
+    'gs_to_def', 'gs_exp_pts_off', 'gs_exp_pts_def', 'gs_exp_pts_st',
+    'gs_is_playoff', 'gs_team_record',
+    'hts_year', 'hts_team', 'hts_team.1',
+    'ats_year', 'ats_team', 'ats_team.1'
+]
+
+
+def read_table(source) -> pd.DataFrame:
+    ''' DataFrames are used as they are, paths are read as Parquet or as the scraper's CSV '''
+    if isinstance(source, pd.DataFrame):
+        return source
+
+    if str(source).endswith('.csv'):
+        df = pd.read_csv(source, sep=';')
+        return df.rename(columns={'Unnamed: 0': 'id'})  # the exported index
+
+    df = pd.read_parquet(source)
+    df['year'] = df['year'].astype(int)  # partition column comes back as a category
+    return df
+
+
+def with_id(df: pd.DataFrame) -> pd.DataFrame:
+    # frames that didn't go through a CSV get the same row ids the CSV index would have
+    if 'id' in df.columns:
+        return df
+    df = df.copy(deep=False)
+    df.insert(0, 'id', np.arange(len(df)))
+    return df
+
+
+def label_playoffs(
+    df_schedules: pd.DataFrame,
+    marker_column: str = 'game_date', marker: str = 'Playoffs'
+) -> pd.Series:
+    ''' True for the games after the 'Playoffs' row of each (year, team) schedule
+
+    Schedules are listed in order, the games after the marker row are the
+    team's playoff games. Rows of a (year, team) don't need to be contiguous.
+    '''
+    is_marker = df_schedules[marker_column].eq(marker)
+    groups = is_marker.groupby([df_schedules['year'], df_schedules['team']], sort=False)
+    return groups.cumsum().gt(0) & ~is_marker
+
+
+def clean_schedules(df_schedules: pd.DataFrame, drop_columns=('boxscore_word',)) -> pd.DataFrame:
+    ''' Games only (no bye weeks or playoff markers), labelled and with readable columns '''
+    is_playoff = label_playoffs(df_schedules)
+    is_game = ~(df_schedules['opp'].eq('Bye Week') | df_schedules['game_date'].eq('Playoffs'))
+    games = np.flatnonzero(is_game)
+    df = df_schedules.take(games)  # the only copy of the schedules
+    for name in drop_columns:
+        if name in df.columns:
+            del df[name]
+    df['is_playoff'] = is_playoff.to_numpy()[games]
+
+    location = df['game_location'].astype(object)  # '@', 'N' or empty
+    df['game_location'] = location.where(location.ne('@'), 'home').where(location.notna(), 'away')
+
+    overtime = df['overtime'].astype(object)
+    df['overtime'] = overtime.where(overtime.ne('OT'), True).where(overtime.notna(), False)
+    return df
+
+
+def lookup_rows(index: pd.MultiIndex, years: pd.Series, teams: pd.Series) -> np.ndarray:
+    ''' Positions of (year, team) in index, -1 where it is missing '''
+    keys = pd.MultiIndex.from_arrays([years.astype('int64'), teams])
+    return index.get_indexer(keys)
+
+
+def take_prefixed(df: pd.DataFrame, positions: np.ndarray, prefix: str) -> pd.DataFrame:
+    rows = df.take(positions)
+    rows.columns = prefix + rows.columns  # the rows are already a new frame, renamed in place
+    rows.index = pd.RangeIndex(len(rows))
+    return rows
+
+
+def merge_games(
+    stats, schedules,
+    prefixes: tuple[str] = (GAME_PREFIX, HOME_PREFIX, AWAY_PREFIX),
+    drop_columns=('boxscore_word',)
+) -> pd.DataFrame:
+    ''' One row per game with the season stats of both teams
+
+    stats and schedules are DataFrames (the scraper's tables, with unique
+    column names) or paths to their CSV/Parquet exports. Season stats are
+    indexed once on (year, team) and looked up for both teams of each game,
+    games whose team or opponent has no stats are dropped (inner join).
+    '''
+    game_prefix, home_prefix, away_prefix = prefixes
+    df_stats = with_id(read_table(stats))
+    df_schedules = clean_schedules(with_id(read_table(schedules)), drop_columns)
+
+    stats_index = pd.MultiIndex.from_arrays([df_stats['year'].astype('int64'), df_stats['team']])
+    if not stats_index.is_unique:
+        raise ValueError('Season stats have more than one row for some (year, team)')
+    home = lookup_rows(stats_index, df_schedules['year'], df_schedules['team'])
+    away = lookup_rows(stats_index, df_schedules['year'], df_schedules['opp'])
+    matched = (home >= 0) & (away >= 0)
+
+    df_games = pd.concat([
+        take_prefixed(df_schedules, np.flatnonzero(matched), game_prefix),
+        take_prefixed(df_stats, home[matched], home_prefix),
+        take_prefixed(df_stats, away[matched], away_prefix),
+    ], axis=1, copy=False)
+    log.info(f'With home and away team stats: {df_games.shape}')
+    return df_games
+
+
+def split_playoffs(df_games: pd.DataFrame, prefix: str = GAME_PREFIX) -> tuple[pd.DataFrame]:
+    ''' (regular season, playoffs) games, both reindexed from 0 '''
+    is_playoff = df_games[prefix + 'is_playoff'].astype(bool)
+    df_regular_season = df_games[~is_playoff].reset_index(drop=True)
+    df_playoffs = df_games[is_playoff].reset_index(drop=True)
+    return df_regular_season, df_playoffs
+
+
+def kaggle_datasets(df_playoffs: pd.DataFrame, test_years: list[int] = KAGGLE_TEST_YEARS) -> dict:
+    ''' Train/test splits of the playoff games, by file name '''
+    df_playoffs = df_playoffs.drop(KAGGLE_DROPPED_COLUMNS, axis=1, errors='ignore')
+    df_playoffs = df_playoffs[df_playoffs['gs_game_location'].isin(['N', 'home'])]
+    df_playoffs = df_playoffs.rename({'gs_game_outcome': 'winorlose'}, axis=1)
+
+    # reordering, target last
+    new_col_order = ['gs_id', 'gs_year', 'gs_team', 'gs_opp']
+    new_col_order += df_playoffs.drop(new_col_order + ['winorlose'], axis=1).columns.tolist() + ['winorlose']
+    df_playoffs = df_playoffs[new_col_order]
+
+    is_test = df_playoffs['gs_year'].isin(test_years)
+    df_kaggle_train = df_playoffs[~is_test]
+    df_kaggle_test = df_playoffs[is_test]
+    df_kaggle_test_labels = df_kaggle_test[['gs_id', 'winorlose']]
+    df_kaggle_test = df_kaggle_test.drop('winorlose', axis=1)  # target col
+
+    sample_submission = [(i, 'W') for i in range(10)] + [(i, 'L') for i in range(10, 20)]
+    df_sample_submission = pd.DataFrame(sample_submission, columns=['gs_id', 'winorlose'])
+    return {
+        'df_kaggle_train.csv': df_kaggle_train,
+        'df_kaggle_test.csv': df_kaggle_test,
+        'df_kaggle_test_labels.csv': df_kaggle_test_labels,
+        'df_kaggle_sample_submission.csv': df_sample_submission,
+    }
+
+
+def export_merged(df_games: pd.DataFrame, base_path: str, kaggle: bool = True):
+    ''' Writes all_games.csv, playoffs.csv, regular_season.csv and the kaggle files '''
+    df_regular_season, df_playoffs = split_playoffs(df_games)
+
+    df_games.to_csv(os.path.join(base_path, 'all_games.csv'), sep=';', encoding='utf-8', index=True)
+    df_playoffs.to_csv(os.path.join(base_path, 'playoffs.csv'), sep=';', encoding='utf-8', index=True)
+    df_regular_season.to_csv(os.path.join(base_path, 'regular_season.csv'), sep=';', encoding='utf-8', index=True)
+    log.info(f'Exported all_games.csv, playoffs.csv and regular_season.csv to {base_path}')
+
+    if not kaggle:
+        return
+    for filename, df in kaggle_datasets(df_playoffs).items():
+        df.to_csv(os.path.join(base_path, filename), sep=';', encoding='utf-8', index=False)
+    log.info(f'Exported the kaggle data to {base_path}')
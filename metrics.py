@@ -0,0 +1,160 @@
+'''
+Run metrics: stage times, request latencies, bytes, queue depths, parse times, retries
+
+Written with -metrics as JSON lines, or Prometheus text format for .prom files.
+'''
+import json
+import logging
+import sys
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+log = logging.getLogger('nflss')
+
+METRIC_PREFIX = 'nflss_'
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+PARSE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def escape_label(value) -> str:
+    ''' Label value as the Prometheus text format quotes it '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def configure_logging(level: str = 'info'):
+    ''' The scraper's messages on stdout, from `level` up (debug shows every page) '''
+    if not log.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(level.upper())
+
+
+class Histogram:
+    ''' Cumulative bucket counts, sum and count, like a Prometheus histogram '''
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple]:
+        ''' (upper bound, observations <= bound) '''
+        total = 0
+        pairs = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class Metrics:
+    ''' Counters, gauges (last and max value) and histograms, by name and labels '''
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name: str, value: float = 1, **labels):
+        self.counters[self.key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = self.key(name, labels)
+        _, peak = self.gauges.get(key, (value, value))
+        self.gauges[key] = (value, max(peak, value))
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        key = self.key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def get(self, name: str, **labels) -> float:
+        return self.counters.get(self.key(name, labels), 0)
+
+    def total(self, name: str) -> float:
+        ''' Sum of a counter over all its labels '''
+        return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    @contextmanager
+    def stage(self, name: str, message: str = None):
+        ''' Times a stage into stage_seconds, logs `message in Xs` when it ends '''
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        self.count('stage_seconds', seconds, stage=name)
+        if message:
+            log.info(f'{message} in {round(seconds, 3)}s')
+
+    def records(self) -> list[dict]:
+        ''' One dict per metric and label set '''
+        records = []
+        for (name, labels), value in sorted(self.counters.items()):
+            records.append({'metric': name, 'type': 'counter', 'labels': dict(labels), 'value': round(value, 6)})
+        for (name, labels), (value, peak) in sorted(self.gauges.items()):
+            records.append({'metric': name, 'type': 'gauge', 'labels': dict(labels), 'value': value, 'max': peak})
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            records.append({
+                'metric': name, 'type': 'histogram', 'labels': dict(labels),
+                'count': histogram.count, 'sum': round(histogram.sum, 6),
+                'buckets': {str(bound): count for bound, count in histogram.cumulative()},
+            })
+        return records
+
+    def write_json_lines(self, path: str):
+        now = time.time()
+        with open(path, 'w') as file:
+            for record in self.records():
+                file.write(json.dumps({'time': now, **record}) + '\n')
+
+    def write_prometheus(self, path: str):
+        lines = []
+        typed = set()
+
+        def add(family, kind, sample, labels, value):
+            if family not in typed:  # one TYPE line per metric family
+                typed.add(family)
+                lines.append(f'# TYPE {METRIC_PREFIX}{family} {kind}')
+            label_text = ','.join(f'{label}="{escape_label(label_value)}"' for label, label_value in labels.items())
+            sample = METRIC_PREFIX + sample + (f'{{{label_text}}}' if label_text else '')
+            lines.append(f'{sample} {value}')
+
+        for record in self.records():
+            name, labels = record['metric'], record['labels']
+            if record['type'] == 'histogram':
+                for bound, count in record['buckets'].items():
+                    add(name, 'histogram', name + '_bucket', {**labels, 'le': bound}, count)
+                add(name, 'histogram', name + '_sum', labels, record['sum'])
+                add(name, 'histogram', name + '_count', labels, record['count'])
+            elif record['type'] == 'gauge':
+                add(name, 'gauge', name, labels, record['value'])
+                add(name + '_max', 'gauge', name + '_max', labels, record['max'])
+            else:
+                # classic text format: the TYPE line names the sample, _total included
+                add(name + '_total', 'counter', name + '_total', labels, record['value'])
+
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def write(self, path: str):
+        ''' Prometheus text format for .prom files, JSON lines otherwise '''
+        if path.endswith('.prom'):
+            self.write_prometheus(path)
+        else:
+            self.write_json_lines(path)
@@ -0,0 +1,214 @@
+'''
+On-disk page cache shared by the async and the standard scraping engines
+'''
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from typing import NamedTuple, Optional
+
+
+class CachedPage(NamedTuple):
+    url: str
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    encoding: Optional[str]
+    fetched_at: float
+
+
+class PageCache:
+    ''' Content-addressed HTML cache
+
+    Pages are indexed by URL in a small SQLite file, while the (zlib compressed)
+    bodies are stored once per content hash under `objects/`, so identical pages
+    served from different URLs share the same blob.
+
+    Parsed results can be stored next to a page, they stay valid for as long as
+    the page body (and the parser version) doesn't change.
+    '''
+
+    def __init__(
+        self, cache_dir: str = os.path.join('data', 'cache'),
+        ttl: float = None, max_size: int = 512 * 1024 ** 2
+    ):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.ttl = ttl  # seconds, None = never expires
+        self.max_size = max_size  # bytes of compressed bodies kept on disk
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.connection = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self.connection is not None:
+            return self.connection
+
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'))
+        self.connection.execute(
+            '''CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                encoding TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )'''
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)')
+        self.connection.execute(
+            '''CREATE TABLE IF NOT EXISTS parsed (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                payload BLOB NOT NULL
+            )'''
+        )
+        self.connection.commit()
+        return self.connection
+
+    def __getstate__(self):
+        # connections can't be pickled into pool workers, they reconnect on first use
+        state = self.__dict__.copy()
+        state['connection'] = None
+        return state
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def is_expired(self, fetched_at: float) -> bool:
+        return self.ttl is not None and (time.time() - fetched_at) > self.ttl
+
+    def get(self, url: str, ignore_ttl: bool = False) -> Optional[CachedPage]:
+        ''' Returns the cached page for url, or None if missing or expired '''
+        row = self.db.execute(
+            'SELECT digest, etag, last_modified, encoding, fetched_at FROM pages WHERE url = ?',
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        digest, etag, last_modified, encoding, fetched_at = row
+        if not ignore_ttl and self.is_expired(fetched_at):
+            return None
+
+        try:
+            with open(self.blob_path(digest), 'rb') as file:
+                body = zlib.decompress(file.read())
+        except (FileNotFoundError, zlib.error):  # blob removed or damaged, forget the entry
+            self.db.execute('DELETE FROM pages WHERE url = ?', (url,))
+            self.db.commit()
+            return None
+
+        self.db.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        self.db.commit()
+        return CachedPage(url, body, etag, last_modified, encoding, fetched_at)
+
+    def put(
+        self, url: str, body: bytes, etag: str = None,
+        last_modified: str = None, encoding: str = None
+    ):
+        ''' Stores body for url, evicting old pages if the cache grows too large '''
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zlib.compress(body, 6)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as file:
+                file.write(compressed)
+            os.replace(tmp_path, path)  # atomic, readers never see partial blobs
+            size = len(compressed)
+
+        old_digest = self.db.execute('SELECT digest FROM pages WHERE url = ?', (url,)).fetchone()
+        now = time.time()
+        self.db.execute(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, digest, size, etag, last_modified, encoding, now, now)
+        )
+        self.db.commit()
+        if old_digest is not None and old_digest[0] != digest:
+            self.remove_orphan_blobs([old_digest[0]])
+
+        self.evict()
+
+    def touch(self, url: str):
+        ''' Marks url as just fetched, used when the server says it didn't change '''
+        self.db.execute('UPDATE pages SET fetched_at = ? WHERE url = ?', (time.time(), url))
+        self.db.commit()
+
+    def get_parsed(self, url: str, version: int):
+        ''' Returns the parsed result stored for url's current body, or None '''
+        row = self.db.execute(
+            '''SELECT parsed.payload FROM parsed JOIN pages
+               ON parsed.url = pages.url AND parsed.digest = pages.digest
+               WHERE parsed.url = ? AND parsed.version = ?''',
+            (url, version)
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put_parsed(self, url: str, result, version: int):
+        ''' Stores a parsed result for url's current body '''
+        row = self.db.execute('SELECT digest FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:  # page not cached (evicted), nothing to attach to
+            return
+        payload = zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL), 6)
+        self.db.execute(
+            'INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)',
+            (url, row[0], version, payload)
+        )
+        self.db.commit()
+
+    def total_size(self) -> int:
+        total = self.db.execute(
+            'SELECT SUM(size) FROM (SELECT DISTINCT digest, size FROM pages)'
+        ).fetchone()[0]
+        return total or 0
+
+    def evict(self):
+        ''' Drops least recently used pages until the cache fits in max_size '''
+        excess = self.total_size() - self.max_size
+        if excess <= 0:
+            return
+
+        evicted_urls = []
+        evicted_digests = set()
+        for url, digest, size in self.db.execute(
+            'SELECT url, digest, size FROM pages ORDER BY accessed_at'
+        ).fetchall():
+            if excess <= 0:
+                break
+            evicted_urls.append((url,))
+            if digest not in evicted_digests:
+                evicted_digests.add(digest)
+                excess -= size
+
+        self.db.executemany('DELETE FROM pages WHERE url = ?', evicted_urls)
+        self.db.executemany('DELETE FROM parsed WHERE url = ?', evicted_urls)
+        self.db.commit()
+        self.remove_orphan_blobs(evicted_digests)
+
+    def remove_orphan_blobs(self, digests):
+        for digest in digests:
+            in_use = self.db.execute(
+                'SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)
+            ).fetchone()
+            if in_use is None:
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,348 @@
+'''
+Season and team page parsers, selected with -parser
+'''
+import re
+import bs4
+from collections import defaultdict
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # optional, only needed by LxmlParser
+    lxml = None
+
+
+TABLES_TO_EXTRACT = [
+    'all_AFC', 'all_NFC', 'all_team_stats', 'all_passing',
+    'all_rushing', 'all_returns', 'all_kicking',
+    'all_team_scoring', 'all_team_conversions', 'all_drives'
+]
+LINK_TABLES = ['all_AFC', 'all_NFC']
+TAG_PATTERN = re.compile('(<.+?>)')
+COMMENT_PATTERN = re.compile(r'<!--(.*?)-->', re.DOTALL)
+ID_PATTERN = re.compile(r'''(?:^|\s)id\s*=\s*["']([^"']*)["']''')
+CLASS_PATTERN = re.compile(r'''(?:^|\s)class\s*=\s*["']([^"']*)["']''')
+if lxml is not None:
+    TEXT_CONTENT = etree.XPath('string()', smart_strings=False)
+
+
+def describe_stat(attrs: dict) -> tuple[str]:
+    stat_name = TAG_PATTERN.sub('', attrs.get('data-stat') or 'NULL')
+    label = TAG_PATTERN.sub('', attrs.get('aria-label') or 'NULL')
+    tip = TAG_PATTERN.sub('', attrs.get('data-tip') or 'NULL')
+    return stat_name, label, tip
+
+
+def find_fragments(html: str, tag: str, ids, html_class: str = None) -> dict:
+    ''' Returns the raw markup of the wanted elements, by id
+
+    Single pass over the page matching only `tag` open/close tags, stops as soon
+    as every wanted element has been closed.
+    '''
+    tag_pattern = re.compile(rf'<(/?){tag}\b([^>]*)>', re.IGNORECASE)
+    ids = set(ids)
+    fragments = {}
+    open_elements = []  # (id, start, depth)
+    depth = 0
+    for match in tag_pattern.finditer(html):
+        if match.group(1):  # closing tag
+            depth -= 1
+            if open_elements and open_elements[-1][2] == depth:
+                element_id, start, _ = open_elements.pop()
+                fragments[element_id] = html[start:match.end()]
+                if not open_elements and len(fragments) == len(ids):
+                    break
+            continue
+
+        attrs = match.group(2)
+        id_match = ID_PATTERN.search(attrs)
+        if id_match is not None and id_match.group(1) in ids and id_match.group(1) not in fragments:
+            class_match = CLASS_PATTERN.search(attrs)
+            classes = class_match.group(1).split() if class_match else []
+            if html_class is None or html_class in classes:
+                open_elements.append((id_match.group(1), match.start(), depth))
+        depth += 1
+
+    return fragments
+
+
+def uncomment_fragment(html: str) -> str:
+    # drops the comment markers, commented tables become regular markup
+    return COMMENT_PATTERN.sub(r'\1', html)
+
+
+class SoupParser:
+    ''' BeautifulSoup + html.parser, the reference implementation
+
+    With targeted=True only the wanted tables are cut out of the raw page and
+    parsed, instead of building a tree for the whole document.
+    '''
+
+    def __init__(self, base_url: str, targeted: bool = False):
+        self.base_url = base_url
+        self.targeted = targeted
+        self.tables_to_extract = TABLES_TO_EXTRACT
+
+    def get_table_wrappers(self, html) -> dict:
+        ''' Table wrapper divs by id, already uncommented '''
+        wrappers = {}
+        if self.targeted:
+            fragments = find_fragments(html, 'div', self.tables_to_extract, 'table_wrapper')
+            for table_id, fragment in fragments.items():
+                soup = bs4.BeautifulSoup(uncomment_fragment(fragment), 'html.parser')
+                wrappers[table_id] = soup.find('div')
+            return wrappers
+
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        for table_id in self.tables_to_extract:
+            table_html = soup.find('div', {'class': 'table_wrapper',
+                                           'id': table_id})
+            if table_html is not None:
+                wrappers[table_id] = self.uncomment_table(table_html)
+        return wrappers
+
+    def get_games_table(self, html):
+        if self.targeted:
+            html = find_fragments(html, 'table', ['games']).get('games', '')
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        return soup.find('table', {'id': 'games'})
+
+    def get_team_page_links(self, html):
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        team_page_links = soup.find_all('a')  # individual team page
+        links = {}
+        for link in team_page_links:
+            team_name = link.text
+            url = self.base_url + link.attrs['href']
+            links[team_name] = url
+        return links
+
+    def uncomment_table(self, html):
+        # uncomment all html code, needed for some tables
+        for comment in html(text=lambda text: isinstance(text, bs4.Comment)):
+            tag = bs4.BeautifulSoup(comment, 'html.parser')
+            comment.replace_with(tag)
+
+        return html
+
+    def extract_data_from_table(self, table_html: bs4.element.Tag):
+        tbody = table_html.find('tbody')
+        season_data = {}
+        for row in tbody.find_all('tr', {'class': ''}):
+            team_name = row.find(attrs={'data-stat': 'team'}).text
+            team_name = team_name.replace('*', '').replace('+', '')
+            current_team = {}
+
+            # season stats
+            for col in row.find_all('td'):
+                stat_name = col['data-stat']
+                stat_value = col.text
+                current_team[stat_name] = stat_value
+
+            season_data[team_name] = current_team
+        return season_data
+
+    def extract_stat_descriptions(
+        self, table_html: bs4.element.Tag,
+        html_tag: str = 'th', html_class: dict = None
+        ) -> list[tuple[str]]:
+        stat_headers = table_html.find_all(html_tag, html_class)
+        return [describe_stat(header.attrs) for header in stat_headers]
+
+    def describe_schema(self, schema: tuple, known_schemas, extract) -> dict:
+        ''' {schema: descriptions}, None for a schema in known_schemas, extract() isn't called then
+
+        A table schema is (table id, stat names of its header).
+        '''
+        if schema[1] and schema in known_schemas:
+            return {schema: None}
+        return {schema: list(dict.fromkeys(extract()))}
+
+    def header_stats(self, table) -> tuple:
+        thead = table.find('thead')
+        if thead is None:
+            return ()
+        return tuple(header['data-stat'] for header in thead.find_all('th') if header.get('data-stat'))
+
+    def parse_season_page(self, html, known_schemas=()):
+        ''' Returns season stats by team, team page links and stat descriptions by table schema '''
+        wrappers = self.get_table_wrappers(html)
+        links_html = ''
+        season_data = defaultdict(defaultdict)
+        stat_descriptions = {}
+        for table_id in self.tables_to_extract:
+            table_html = wrappers.get(table_id)
+            if table_html is None:
+                continue
+
+            table_data = self.extract_data_from_table(table_html)
+            headers = table_html.find_all('th', {'class': 'poptip'})
+            schema = (table_id, tuple(header.get('data-stat') for header in headers))
+            stat_descriptions.update(self.describe_schema(
+                schema, known_schemas, lambda: [describe_stat(header.attrs) for header in headers]
+            ))
+            if table_id in LINK_TABLES:
+                links_html += str(table_html)
+
+            for team_name, team_stats in table_data.items():
+                season_data[team_name] = season_data[team_name] | team_stats
+        links = self.get_team_page_links(links_html)
+        return season_data, links, stat_descriptions
+
+    def parse_team_page(self, html, known_schemas=()):
+        ''' Returns the team's games, by row, and stat descriptions by table schema '''
+        table = self.get_games_table(html)
+        tbody = table.find('tbody')
+        team_schedule = {}
+        stat_descriptions = self.describe_schema(
+            ('games', self.header_stats(table)), known_schemas,
+            lambda: self.extract_stat_descriptions(tbody, 'td')  # every row, the costly part
+        )
+        # games in season
+        for irow, row in enumerate(tbody.find_all('tr', {'class': ''})):
+            row_stats = {}
+            # game stats
+            for col in row.find_all('td'):  # each column in current row
+                stat_name = col['data-stat']  # stat name
+                stat_value = col.text
+                row_stats[stat_name] = stat_value
+
+            row_stats['week_num'] = row.find('th', {'data-stat': 'week_num'}).text
+            team_schedule[irow] = row_stats
+        return team_schedule, stat_descriptions
+
+
+class LxmlParser(SoupParser):
+    ''' lxml implementation, same output as SoupParser at a fraction of the cost
+
+    Goes straight to the known `div.table_wrapper#all_*` and `table#games`
+    elements with XPath instead of walking the whole tree for every lookup.
+    '''
+
+    def __init__(self, base_url: str, targeted: bool = False):
+        if lxml is None:
+            raise ImportError('The lxml parser needs lxml, install it with: pip install lxml')
+        super().__init__(base_url, targeted)
+
+    @staticmethod
+    def text(element) -> str:
+        # plain str, text_content() returns "smart" strings that keep their element alive
+        return TEXT_CONTENT(element)
+
+    @staticmethod
+    def is_data_row(row) -> bool:
+        # same rows as find_all('tr', {'class': ''}), no class or an empty one
+        return not row.get('class', '').split()
+
+    def get_table_wrappers(self, html) -> dict:
+        wrappers = {}
+        if self.targeted:
+            fragments = find_fragments(html, 'div', self.tables_to_extract, 'table_wrapper')
+            for table_id, fragment in fragments.items():
+                wrappers[table_id] = lxml.html.fragment_fromstring(uncomment_fragment(fragment))
+            return wrappers
+
+        root = lxml.html.fromstring(html)
+        for div in root.iter('div'):
+            if 'table_wrapper' in div.get('class', '').split():
+                wrappers.setdefault(div.get('id'), div)  # first match, like soup.find
+        return {
+            table_id: self.uncomment_table(wrappers[table_id])
+            for table_id in self.tables_to_extract if table_id in wrappers
+        }
+
+    def get_games_table(self, html):
+        if self.targeted:
+            return lxml.html.fragment_fromstring(find_fragments(html, 'table', ['games'])['games'])
+        return lxml.html.fromstring(html).xpath('//table[@id="games"]')[0]
+
+    def uncomment_table(self, html):
+        for comment in html.xpath('.//comment()'):
+            if not comment.text or not comment.text.strip():
+                continue
+            tag = lxml.html.fragment_fromstring(comment.text, create_parent='div')
+            tag.tail = comment.tail
+            comment.getparent().replace(comment, tag)
+
+        return html
+
+    def extract_data_from_table(self, table_html):
+        tbody = table_html.find('.//tbody')
+        season_data = {}
+        for row in tbody.iter('tr'):
+            if not self.is_data_row(row):
+                continue
+            team_name = self.text(row.xpath('.//*[@data-stat="team"]')[0])
+            team_name = team_name.replace('*', '').replace('+', '')
+            current_team = {}
+
+            # season stats
+            for col in row.iter('td'):
+                current_team[col.attrib['data-stat']] = self.text(col)
+
+            season_data[team_name] = current_team
+        return season_data
+
+    def extract_stat_descriptions(
+        self, table_html, html_tag: str = 'th', html_class: str = None
+        ) -> list[tuple[str]]:
+        descriptions = []
+        for header in table_html.iter(html_tag):
+            if html_class is None or html_class in header.get('class', '').split():
+                descriptions.append(describe_stat(header.attrib))
+        return descriptions
+
+    def header_stats(self, table) -> tuple:
+        thead = table.find('.//thead')
+        if thead is None:
+            return ()
+        return tuple(header.get('data-stat') for header in thead.iter('th') if header.get('data-stat'))
+
+    def parse_season_page(self, html, known_schemas=()):
+        wrappers = self.get_table_wrappers(html)
+        links = {}
+        season_data = defaultdict(defaultdict)
+        stat_descriptions = {}
+        for table_id in self.tables_to_extract:
+            table_html = wrappers.get(table_id)
+            if table_html is None:
+                continue
+
+            table_data = self.extract_data_from_table(table_html)
+            headers = [header for header in table_html.iter('th') if 'poptip' in header.get('class', '').split()]
+            schema = (table_id, tuple(header.get('data-stat') for header in headers))
+            stat_descriptions.update(self.describe_schema(
+                schema, known_schemas, lambda: [describe_stat(header.attrib) for header in headers]
+            ))
+            if table_id in LINK_TABLES:
+                for link in table_html.iter('a'):  # individual team page
+                    links[self.text(link)] = self.base_url + link.attrib['href']
+
+            for team_name, team_stats in table_data.items():
+                season_data[team_name] = season_data[team_name] | team_stats
+        return season_data, links, stat_descriptions
+
+    def parse_team_page(self, html, known_schemas=()):
+        table = self.get_games_table(html)
+        tbody = table.find('.//tbody')
+        team_schedule = {}
+        stat_descriptions = self.describe_schema(
+            ('games', self.header_stats(table)), known_schemas,
+            lambda: self.extract_stat_descriptions(tbody, 'td')
+        )
+        # games in season
+        rows = [row for row in tbody.iter('tr') if self.is_data_row(row)]
+        for irow, row in enumerate(rows):
+            row_stats = {}
+            for col in row.iter('td'):
+                row_stats[col.attrib['data-stat']] = self.text(col)
+
+            row_stats['week_num'] = self.text(row.xpath('.//th[@data-stat="week_num"]')[0])
+            team_schedule[irow] = row_stats
+        return team_schedule, stat_descriptions
+
+
+PARSERS = {
+    'bs4': SoupParser,
+    'lxml': LxmlParser,
+}
@@ -0,0 +1,47 @@
+'''
+Scrape -> merge -> Kaggle splits in one process, only the final files are written
+'''
+import os
+import sys
+from metrics import configure_logging
+from web_scraper import CustomTimer, build_arg_parser, log, scraper_from_args
+
+
+INTERMEDIATE_EXPORTS = ['o', 'stat', 'ts', 'pickle', 'parquet', 'sqlite']
+
+
+if __name__ == '__main__':
+    timer = CustomTimer()
+    timer.start_timer()
+    # same options as web_scraper.py, the scraped tables are only exported when asked for
+    parser = build_arg_parser('Scrape seasons and export the merged games and Kaggle datasets')
+    parser.add_argument('-d', default='data', help='Output directory of the merged files (default = ./data)')
+    parser.add_argument('-nokaggle', action='store_true', help="Don't export the Kaggle train/test files")
+    args = vars(parser.parse_args())
+    configure_logging(args['log'])
+
+    nfl = None
+    try:
+        nfl = scraper_from_args(args, export_merge=False)
+        nfl.run()
+
+        # scraped tables go straight to the merge as DataFrames
+        nfl.check_complete([path for path in [os.path.join(args['d'], 'all_games.csv')] if os.path.exists(path)])
+        with nfl.metrics.stage('merge', 'Done merging'):
+            nfl.dump_merged_games(args['d'], kaggle=not args['nokaggle'])
+
+        if any(args[name] for name in INTERMEDIATE_EXPORTS):
+            with nfl.metrics.stage('export', 'Done exporting'):
+                nfl.export()
+        else:
+            nfl.remove_checkpoint()
+        if args['metrics']:
+            nfl.metrics.write(args['metrics'])
+        timer.end_timer()
+
+    except Exception as e:
+        log.error(e)
+        if nfl is not None and os.path.exists(nfl.journal.path):
+            log.error('Pages parsed so far were saved, run again with -resume to continue')
+        input()
+        sys.exit(1)
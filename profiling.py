@@ -0,0 +1,144 @@
+'''
+-profile: cProfile and sampled stacks of the main process and of every pool worker
+
+Each process saves its own files, combine_profiles merges them into
+profile.pstats (for pstats/snakeviz), profile.collapsed (folded stacks for
+flamegraph.pl or speedscope) and profile.txt (top functions by cumulative time).
+'''
+import cProfile
+import glob
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from multiprocessing.process import BaseProcess
+from multiprocessing.util import Finalize
+
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+# forked workers still have the frames of the parent that started them, stacks start here
+PROCESS_ROOT = BaseProcess._bootstrap.__code__
+
+
+def frame_stack(frame) -> str:
+    ''' root;...;frame, one `function (file:line)` per frame '''
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        if code is PROCESS_ROOT:
+            break
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    ''' Samples a thread's stack from a background thread while active, like py-spy does from outside '''
+
+    def __init__(self, thread_id: int = None, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.active = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while True:
+            self.active.wait()
+            if self.closed:
+                return
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[frame_stack(frame)] += 1
+            time.sleep(self.interval)
+
+    def close(self):
+        self.closed = True
+        self.active.set()
+        self.thread.join()
+
+
+class Profiler:
+    ''' cProfile plus stack samples of the calling thread, between enable() and disable() '''
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(interval=interval)
+        self.used = False
+
+    def enable(self):
+        self.used = True
+        self.sampler.active.set()
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+        self.sampler.active.clear()
+
+    def save(self, path: str):
+        ''' path.prof and path.collapsed '''
+        self.sampler.close()
+        self.profile.dump_stats(path + '.prof')
+        with open(path + '.collapsed', 'w') as file:
+            for stack, count in self.sampler.stacks.items():
+                file.write(f'{stack} {count}\n')
+
+
+def worker_profiler(profile_dir: str) -> Profiler:
+    ''' Profiler for a pool worker, saved as worker-<pid> when the worker exits if it parsed anything '''
+    profiler = Profiler()
+    path = os.path.join(profile_dir, f'worker-{os.getpid()}')
+
+    def save():
+        if profiler.used:  # idle workers (more workers than pages) would leave an empty profile
+            profiler.save(path)
+        else:
+            profiler.sampler.close()
+    Finalize(profiler, save, exitpriority=10)
+    return profiler
+
+
+def has_stats(path: str) -> bool:
+    try:
+        pstats.Stats(path)
+    except TypeError:  # an empty profile, pstats can't load it
+        return False
+    return True
+
+
+def clear_profiles(profile_dir: str):
+    os.makedirs(profile_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(profile_dir, '*.prof')) + glob.glob(os.path.join(profile_dir, '*.collapsed')):
+        os.remove(path)
+
+
+def combine_profiles(profile_dir: str, top: int = 50) -> str:
+    ''' Merges every process' files, returns the path of the text report '''
+    prof_files = [path for path in sorted(glob.glob(os.path.join(profile_dir, '*.prof'))) if has_stats(path)]
+    stats = pstats.Stats(*prof_files)
+    stats.dump_stats(os.path.join(profile_dir, 'profile.pstats'))
+
+    # stacks are prefixed with the process they came from, main or worker
+    stacks = Counter()
+    for path in glob.glob(os.path.join(profile_dir, '*.collapsed')):
+        process = 'main' if os.path.basename(path).startswith('main') else 'worker'
+        with open(path) as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                stacks[f'{process};{stack}'] += int(count)
+    with open(os.path.join(profile_dir, 'profile.collapsed'), 'w') as file:
+        for stack, count in stacks.most_common():
+            file.write(f'{stack} {count}\n')
+
+    report = io.StringIO()
+    report.write(f'{len(prof_files)} processes: {", ".join(os.path.basename(path) for path in prof_files)}\n')
+    pstats.Stats(*prof_files, stream=report).sort_stats('cumulative').print_stats(top)
+    report_path = os.path.join(profile_dir, 'profile.txt')
+    with open(report_path, 'w') as file:
+        file.write(report.getvalue())
+    return report_path
@@ -0,0 +1,147 @@
+'''
+SQLite export (-sqlite) with indexes on year, team and opponent, and the queries to read it back
+'''
+import json
+import os
+import sqlite3
+import time
+import pandas as pd
+from stat_schema import PANDAS_DTYPES, SCHEMA_VERSION
+
+
+STORE_VERSION = 1
+# (index name, table, columns), point lookups by team and range scans by year
+INDEXES = [
+    ('season_year_team', 'season_stats', ('year', 'team')),
+    ('season_team_year', 'season_stats', ('team', 'year')),
+    ('games_year_team', 'team_schedules', ('year', 'team', 'week_number')),
+    ('games_team_year', 'team_schedules', ('team', 'year')),
+    ('games_opp_year', 'team_schedules', ('opp', 'year')),
+    ('descriptions_stat', 'stat_descriptions', ('stat_name',)),
+]
+
+
+def sql_names(df: pd.DataFrame) -> pd.DataFrame:
+    # team.1 style names (see ColumnarTable.column_names) would need quoting in every query
+    return df.rename(columns=lambda name: name.replace('.', '_'))
+
+
+def write_store(
+    path: str, season_df: pd.DataFrame, schedule_df: pd.DataFrame,
+    stat_descriptions: list[tuple[str]], schema: dict = None
+):
+    ''' Writes the tables and their indexes to path, replacing it once complete
+
+    The database is built next to path and moved in place, queries running
+    against the previous export never see a half written one.
+    '''
+    building_path = path + '.building'
+    if os.path.exists(building_path):
+        os.remove(building_path)
+    connection = sqlite3.connect(building_path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')  # nothing to recover, the file is replaced
+        connection.execute('PRAGMA synchronous = OFF')
+        sql_names(season_df).to_sql('season_stats', connection, index=False)
+        if schedule_df is not None:
+            sql_names(schedule_df).to_sql('team_schedules', connection, index=False)
+        pd.DataFrame(
+            sorted(set(stat_descriptions)), columns=['stat_name', 'label', 'tip']
+        ).to_sql('stat_descriptions', connection, index=False)
+
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for name, table, columns in INDEXES:
+            if table in tables:
+                connection.execute(f'CREATE INDEX {name} ON {table} ({", ".join(columns)})')
+
+        connection.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)')
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', [
+            ('store_version', str(STORE_VERSION)),
+            ('created_at', str(time.time())),
+            ('schema', json.dumps(schema or {'version': SCHEMA_VERSION, 'columns': {}})),
+        ])
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(building_path, path)
+
+
+def year_filter(years) -> tuple:
+    ''' SQL condition and parameters for a year, (first, last) range or None '''
+    if years is None:
+        return None, []
+    if isinstance(years, int):
+        return 'year = ?', [years]
+    first, last = years
+    return 'year BETWEEN ? AND ?', [first, last]
+
+
+class QueryStore:
+    ''' Read side of the -sqlite export
+
+        store = QueryStore('data/1970-2021.sqlite')
+        store.games('Kansas City Chiefs', years=(2010, 2020))
+        store.season_stats(years=2019)
+
+    Results are DataFrames typed like the scraped tables (categories,
+    nullable ints and booleans) from the stat schema stored with the data.
+    '''
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'no SQLite export at {path}, export one with -sqlite')
+        # read only, several jobs can query the same export
+        self.connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        metadata = dict(self.connection.execute('SELECT key, value FROM metadata'))
+        self.created_at = float(metadata['created_at'])
+        self.dtypes = {
+            name.replace('.', '_'): PANDAS_DTYPES[column['type']]
+            for name, column in json.loads(metadata['schema'])['columns'].items()
+        }
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        ''' Any SELECT, typed with the stored schema '''
+        df = pd.read_sql_query(sql, self.connection, params=list(params))
+        for name, dtype in self.dtypes.items():
+            if name in df.columns and dtype != 'object':
+                df[name] = df[name].astype(dtype)
+        return df
+
+    def select(self, table: str, conditions: list[tuple], order_by: str) -> pd.DataFrame:
+        ''' Rows of table matching every (condition, params) that isn't None '''
+        where = [condition for condition, _ in conditions if condition is not None]
+        params = [param for condition, values in conditions if condition is not None for param in values]
+        sql = f'SELECT * FROM {table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return self.query(f'{sql} ORDER BY {order_by}', params)
+
+    def season_stats(self, team: str = None, years=None) -> pd.DataFrame:
+        ''' Season stats of a team (or every team), for a year or a (first, last) range '''
+        return self.select('season_stats', [
+            ('team = ?' if team is not None else None, [team]),
+            year_filter(years),
+        ], 'year, team')
+
+    def games(self, team: str = None, years=None, opponent: str = None) -> pd.DataFrame:
+        ''' Schedule rows of a team, optionally against one opponent '''
+        return self.select('team_schedules', [
+            ('team = ?' if team is not None else None, [team]),
+            ('opp = ?' if opponent is not None else None, [opponent]),
+            year_filter(years),
+        ], 'year, team, week_number')
+
+    def stat_descriptions(self, stat_name: str = None) -> pd.DataFrame:
+        ''' Label and tip of a stat (or of all of them) '''
+        return self.select('stat_descriptions', [
+            ('stat_name = ?' if stat_name is not None else None, [stat_name]),
+        ], 'stat_name')
@@ -0,0 +1,94 @@
+'''
+Compact rows of the scraped pages: RowBatch for a whole page, records for iter_records
+
+Stat names are interned and kept once per page instead of once per row, the
+workers send RowBatches back and the page cache and checkpoint store them.
+'''
+import sys
+from typing import NamedTuple
+
+
+class RowBatch:
+    ''' A page's rows as struct of arrays: a key per row and a column of values per stat
+
+    Stats missing from a row are None in its column.
+    '''
+    __slots__ = ('names', 'keys', 'columns')
+
+    def __init__(self, names: tuple, keys: list, columns: list[list]):
+        self.names = names
+        self.keys = keys
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows: dict, convert=None) -> 'RowBatch':
+        ''' Batch of {row key: {stat name: value}}, values go through convert(stat_name, value) '''
+        positions = {}  # stat name: column, in order of first appearance like ColumnarTable
+        for row in rows.values():
+            for name in row:
+                if name not in positions:
+                    positions[sys.intern(name)] = len(positions)
+
+        columns = [[None] * len(rows) for _ in positions]
+        for irow, row in enumerate(rows.values()):
+            for name, value in row.items():
+                columns[positions[name]][irow] = convert(name, value) if convert else value
+        return cls(tuple(positions), list(rows), columns)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getstate__(self):
+        return self.names, self.keys, self.columns
+
+    def __setstate__(self, state):
+        names, self.keys, self.columns = state
+        self.names = tuple(sys.intern(name) for name in names)  # shared by every page in the parent
+
+    def rows(self):
+        ''' (key, values) per row, values in the order of names '''
+        return zip(self.keys, zip(*self.columns) if self.columns else [()] * len(self.keys))
+
+
+class SeasonRecord(NamedTuple):
+    ''' A team's row of a season page, stats typed with the stat schema '''
+    year: int
+    team: str
+    names: tuple  # stat names, shared by the records of a page
+    values: tuple
+
+    @property
+    def stats(self) -> dict:
+        return dict(zip(self.names, self.values))
+
+
+class GameRecord(NamedTuple):
+    ''' A game of a team page, week_number is its row in the schedule '''
+    year: int
+    team: str
+    week_number: int
+    names: tuple
+    values: tuple
+
+    @property
+    def stats(self) -> dict:
+        return dict(zip(self.names, self.values))
+
+
+def season_records(result) -> list[SeasonRecord]:
+    ''' Records of a parsed season page (process_season_soup's result) '''
+    return [
+        SeasonRecord(year, team, season['season_data'].names, values)
+        for year, season in result[0].items()
+        for team, values in season['season_data'].rows()
+    ]
+
+
+def game_records(result) -> list[GameRecord]:
+    ''' Records of a parsed team page (process_team_page's result) '''
+    return [
+        GameRecord(year, team, week_number, batch.names, values)
+        for year, teams in result[0].items()
+        for team, batch in teams.items()
+        for week_number, values in batch.rows()
+    ]
@@ -8,6 +8,10 @@ import pickle
 import pandas as pd
 import argparse
 import time
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root
+from page_cache import PageCache
 
 class CustomTimer:
 
@@ -25,7 +29,7 @@ class CustomTimer:
 
 class NFLSS:
 
-    def __init__(self, start_year, end_year, export_data, export_stat, export_schedule):
+    def __init__(self, start_year, end_year, export_data, export_stat, export_schedule, page_cache=None):
         self.base_url = r'https://www.pro-football-reference.com'
         self.season_url = self.base_url + r'/years/{}/'
         # self.team_schedule_url = self.base_url + r'/years/{}/games.htm'
@@ -58,13 +62,31 @@ class NFLSS:
         self.export_stat = export_stat
         self.export_schedule = export_schedule
 
+        self.page_cache = page_cache
+
     def build_season_url(self):
         self.current_url = self.season_url.format(self.current_year)
 
+    def get_html(self, url):
+        ''' Requests url, going through the page cache when available '''
+        if self.page_cache is not None:
+            page = self.page_cache.get(url)
+            if page is not None:
+                return page.body.decode(page.encoding or 'utf-8')
+
+        r = requests.get(url)
+        r.raise_for_status()  # error pages (404, 429, 5xx) must not end up in the cache
+        if self.page_cache is not None:
+            self.page_cache.put(
+                url, r.content, r.headers.get('ETag'),
+                r.headers.get('Last-Modified'), r.encoding or r.apparent_encoding
+            )
+        return r.text
+
     def make_soup(self):
         ''' Requests current url and generates new soup '''
-        r = requests.get(self.current_url)
-        self.soup = bs4.BeautifulSoup(r.text, 'html.parser')      
+        html = self.get_html(self.current_url)
+        self.soup = bs4.BeautifulSoup(html, 'html.parser')
     def get_tables(self, table_id):
         ''' Retrieves given table_id's html '''
         current_table = self.soup.find('div', {'class': 'table_wrapper',
@@ -115,8 +137,8 @@ class NFLSS:
 
     def make_team_schedule_soup(self):
         ''' Requests current season schedule url and generates a soup '''
-        r = requests.get(self.current_team_schedule_url)
-        self.current_team_schedule_soup = bs4.BeautifulSoup(r.text, 'html.parser')
+        html = self.get_html(self.current_team_schedule_url)
+        self.current_team_schedule_soup = bs4.BeautifulSoup(html, 'html.parser')
 
     def extract_season_schedule(self, team_name):
         table = self.current_team_schedule_soup.find('table', {'id': 'games'})
@@ -267,16 +289,25 @@ if __name__ == '__main__':
     parser.add_argument('-o', type=str, help='Format to output data')
     parser.add_argument('-stat', action='store_true', help='Export stat descriptions')
     parser.add_argument('-ts', action='store_true', help='Export team schedules')
+    parser.add_argument('-cache', nargs='?', const=os.path.join('data', 'cache'),
+                        help='Cache downloaded pages (default dir = ./data/cache)')
+    parser.add_argument('-ttl', type=float, help='Hours before cached pages expire (default = never)')
 
     args = vars(parser.parse_args())
 
+    page_cache = None
+    if args['cache']:
+        ttl = args['ttl'] * 3600 if args['ttl'] else None
+        page_cache = PageCache(args['cache'], ttl=ttl)
+
     try:
         nfl = NFLSS(
             start_year=args['start_year'],
             end_year=args['end_year'],
             export_data=args['o'],
             export_stat=args['stat'],
-            export_schedule=args['ts']
+            export_schedule=args['ts'],
+            page_cache=page_cache
         )
         nfl.run_multiple_years()
         nfl.export()
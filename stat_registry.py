@@ -0,0 +1,102 @@
+'''
+Stat descriptions keyed by data-stat, and the table schemas they were described in
+
+Workers describe each table schema (table id + stat names of its header) once
+and afterwards send None for it, the registry fills those back in. It is
+exported as _stat_registry.json, with a version, next to the descriptions CSV.
+'''
+import json
+import logging
+
+
+log = logging.getLogger('nflss')
+
+REGISTRY_VERSION = 1
+
+
+class StatRegistry:
+    ''' Deduplicated stat descriptions, plus the years every table schema was seen in
+
+    A table whose stats differ from the previous season's is a schema change,
+    see schema_changes.
+    '''
+
+    def __init__(self):
+        self.stats = {}  # data-stat: {(label, tip): None}, every description it came with
+        self.schemas = {}  # (table id, stat names): descriptions
+        self.schema_years = {}  # (table id, stat names): years
+
+    def add_descriptions(self, descriptions: list[tuple[str]]):
+        for stat_name, label, tip in descriptions:
+            self.stats.setdefault(stat_name, {})[(label, tip)] = None
+
+    def add_page(self, year: int, page_descriptions: dict) -> dict:
+        ''' Merges a parsed page's {schema: descriptions}, returns them with the None filled in '''
+        complete = {}
+        for schema, descriptions in page_descriptions.items():
+            if descriptions is None:
+                descriptions = self.schemas.get(schema)
+                if descriptions is None:  # its first page never arrived, e.g. a worker crashed
+                    log.debug(f'\tNo descriptions for the {schema[0]} table of {year}')
+                    continue
+            elif schema not in self.schemas:
+                self.schemas[schema] = descriptions
+                self.add_descriptions(descriptions)
+            self.schema_years.setdefault(schema, set()).add(year)
+            complete[schema] = descriptions
+        return complete
+
+    def descriptions(self) -> list[tuple[str]]:
+        ''' (stat_name, label, tip) rows, sorted '''
+        return sorted(
+            (stat_name, label, tip)
+            for stat_name, variants in self.stats.items()
+            for label, tip in variants
+        )
+
+    def schema_changes(self) -> list[tuple]:
+        ''' (table id, year, added stats, removed stats) for every season a table changed in '''
+        by_table = {}
+        for (table_id, stat_names), years in self.schema_years.items():
+            for year in years:
+                by_table.setdefault(table_id, {})[year] = stat_names
+
+        changes = []
+        for table_id, stats_by_year in sorted(by_table.items()):
+            previous = None
+            for year, stat_names in sorted(stats_by_year.items()):
+                if previous is not None and stat_names != previous:
+                    added = [name for name in stat_names if name not in previous]
+                    removed = [name for name in previous if name not in stat_names]
+                    changes.append((table_id, year, added, removed))
+                previous = stat_names
+        return changes
+
+    def write(self, path: str):
+        tables = {}
+        for (table_id, stat_names), descriptions in self.schemas.items():
+            tables.setdefault(table_id, []).append({
+                'stats': list(stat_names),
+                'years': sorted(self.schema_years.get((table_id, stat_names), ())),
+                'descriptions': [list(description) for description in descriptions],
+            })
+        with open(path, 'w') as file:
+            json.dump({'version': REGISTRY_VERSION, 'stats': self.descriptions(), 'tables': tables}, file, indent=1)
+
+    def read(self, path: str) -> bool:
+        ''' Merges a registry written by write, False if there is none or it has another version '''
+        try:
+            with open(path) as file:
+                registry = json.load(file)
+        except FileNotFoundError:
+            return False
+        if registry.get('version') != REGISTRY_VERSION:
+            return False
+
+        self.add_descriptions(tuple(row) for row in registry['stats'])
+        for table_id, schemas in registry['tables'].items():
+            for schema in schemas:
+                key = (table_id, tuple(schema['stats']))
+                self.schemas.setdefault(key, [tuple(row) for row in schema['descriptions']])
+                self.schema_years.setdefault(key, set()).update(schema['years'])
+        return True
@@ -0,0 +1,106 @@
+'''
+Stat types by data-stat name, scraped cells are converted once, in the pool workers
+'''
+import json
+import re
+from columnar import INT_PATTERN, parse_value
+
+
+SCHEMA_VERSION = 1
+STAT_TYPES = ('int', 'float', 'bool', 'category', 'str')
+
+# data-stats that aren't numbers, every other stat is a count (int) unless its name says otherwise
+NAMED_TYPES = {
+    'team': 'category',
+    'opp': 'category',
+    'game_location': 'category',  # '@', 'N' or empty
+    'game_outcome': 'category',  # W, L, T
+    'game_day_of_week': 'category',
+    'boxscore_word': 'category',
+    'week_num': 'category',  # 1..17, then WildCard, Division, ConfChamp, SuperBowl
+    'overtime': 'bool',  # 'OT' or empty
+    'game_date': 'str',  # 'September 12' without the year, or the 'Playoffs' marker row
+    'gametime': 'str',
+    'team_record': 'str',  # 3-1
+    'start_avg': 'str',  # Own 28.3
+    'time_avg': 'str',  # 2:43
+}
+FLOAT_PATTERN = re.compile(r'_perc|_pct|_per_|_avg$|exp_pts|^mov$|^srs_|^sos_|rating')
+
+# pandas dtypes to read exported columns back without inferring them
+PANDAS_DTYPES = {
+    'int': 'Int64',
+    'float': 'float64',
+    'bool': 'boolean',
+    'category': 'category',
+    'str': 'object',
+}
+
+
+class StatSchema:
+    ''' Maps data-stat names to int/float/bool/category/str
+
+    Stats not in NAMED_TYPES are numbers, floats when their name says so
+    (percentages, averages, expected points...). A cell that doesn't fit its
+    type is kept as parsed, the column store widens the column for it.
+    '''
+
+    def __init__(self, types: dict = None):
+        self.types = dict(NAMED_TYPES)
+        self.types.update(types or {})
+
+    def type_of(self, stat_name: str) -> str:
+        stat_type = self.types.get(stat_name)
+        if stat_type is None:
+            stat_type = 'float' if FLOAT_PATTERN.search(stat_name) else 'int'
+        return stat_type
+
+    def convert(self, stat_name: str, text: str):
+        stat_type = self.type_of(stat_name)
+        if stat_type == 'bool':
+            return text != ''
+        if text == '':
+            return None
+        if stat_type in ('category', 'str'):
+            return text
+        if stat_type == 'int' and INT_PATTERN.fullmatch(text):
+            return int(text)
+        if stat_type == 'float':
+            try:
+                return float(text)
+            except ValueError:
+                pass
+        return parse_value(text)
+
+    def convert_row(self, row: dict) -> dict:
+        return {stat_name: self.convert(stat_name, text) for stat_name, text in row.items()}
+
+
+def describe_columns(tables: dict, stat_descriptions: list[tuple[str]]) -> dict:
+    ''' Schema of the exported tables: stored type, label and tip of every column '''
+    descriptions = {stat_name: (label, tip) for stat_name, label, tip in stat_descriptions}
+    columns = {}
+    for table_name, table in tables.items():
+        for name, stat_type in table.column_types().items():
+            label, tip = descriptions.get(name, ('NULL', 'NULL'))
+            columns.setdefault(name, {'type': stat_type, 'label': label, 'tip': tip, 'tables': []})
+            columns[name]['tables'].append(table_name)
+    return {'version': SCHEMA_VERSION, 'columns': columns}
+
+
+def write_schema(path: str, schema: dict):
+    with open(path, 'w') as file:
+        json.dump(schema, file, indent=1)
+
+
+def read_dtypes(path: str) -> dict:
+    ''' pandas dtypes by column name from an exported schema, {} without one '''
+    try:
+        with open(path) as file:
+            schema = json.load(file)
+    except FileNotFoundError:
+        return {}
+    return {
+        name: PANDAS_DTYPES[column['type']]
+        for name, column in schema['columns'].items()
+    }
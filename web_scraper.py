@@ -2,18 +2,42 @@
 Asyncio + multiprocessing.Pool
 '''
 import asyncio
-import aiohttp
 import argparse
+import glob
+import logging
 import time
-import bs4
-import pandas as pd
 import os
+import sys
 import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pickle
-import re
 import csv
+import shutil
 from collections import defaultdict
+from checkpoint import CheckpointJournal
+from columnar import ColumnarTable
+from fetcher import FetchError, FetchScheduler
+from incremental import (
+    find_previous_export, read_export, read_manifest,
+    read_stat_descriptions, plan_scrape, write_manifest
+)
+from merge_script.merge_engine import export_merged, merge_games
+from metrics import PARSE_BUCKETS, configure_logging
+from page_cache import PageCache
+from parsers import PARSERS
+from profiling import Profiler, clear_profiles, combine_profiles, worker_profiler
+from query_store import write_store
+from records import RowBatch, SeasonRecord, game_records, season_records
+from stat_registry import StatRegistry
+from stat_schema import StatSchema, describe_columns, write_schema
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed by -parquet
+    pa = None
+
+log = logging.getLogger('nflss')  # -log sets the level, per-page messages are debug
 
 class CustomTimer:
 
@@ -27,38 +51,114 @@ class CustomTimer:
         end = time.time()
         time_elapsed = end - self.start
         time_elapsed_formated = round(time_elapsed, 3)
-        print(f'\n\nTime elapsed: {time_elapsed_formated}s')
+        log.info(f'Time elapsed: {time_elapsed_formated}s')
+
+# pool workers get their parser and stat schema once, from init_worker, tasks only carry one page
+worker_parser = None
+worker_schema = None
+worker_profile = None  # -profile, only the parsing is profiled, not the wait for tasks
+worker_schemas = set()  # table schemas this worker already sent the stat descriptions of
+
+
+def init_worker(parser, schema, log_level: str = None, profile_dir: str = None):
+    global worker_parser, worker_schema, worker_profile, worker_schemas
+    worker_parser = parser
+    worker_schema = schema
+    worker_schemas = set()
+    if log_level:  # spawned workers (windows) don't inherit the logging setup
+        configure_logging(log_level)
+    if profile_dir:
+        worker_profile = worker_profiler(profile_dir)
+
+
+def timed_parse(task):
+    ''' Runs parse on args in a worker, returns its result, parse time and the worker's pid '''
+    parse, args = task
+    if worker_profile is not None:
+        worker_profile.enable()
+    start = time.perf_counter()
+    try:
+        result = parse(args)
+    finally:  # a page that fails to parse must not leave the profiler on for the worker's next tasks
+        seconds = time.perf_counter() - start
+        if worker_profile is not None:
+            worker_profile.disable()
+    return result, seconds, os.getpid()
+
+
+def process_season_soup(args):
+    year, html = args
+    log.debug(f'\tProcessing {year} season')
+    season_data, links, stat_descriptions = worker_parser.parse_season_page(html, worker_schemas)
+    worker_schemas.update(stat_descriptions)
+    season_data = RowBatch.from_rows(season_data, worker_schema.convert)  # rows by team
+
+    log.debug(f'Done processing {year} season')
+    season_dict = {year: {'season_data': season_data, 'team_links': links}}
+    return season_dict, stat_descriptions
+
+
+def process_team_page(args):
+    html, team_name, year = args
+    team_schedule, stat_descriptions = worker_parser.parse_team_page(html, worker_schemas)
+    worker_schemas.update(stat_descriptions)
+    team_schedule = RowBatch.from_rows(team_schedule, worker_schema.convert)  # rows by week_number
+
+    log.debug(f'Done processing {team_name} {year} team page.')
+    season_dict = {year: {team_name: team_schedule}}
+    return season_dict, stat_descriptions
+
+
+PAGE_KINDS = {process_season_soup: 'season', process_team_page: 'team'}  # parse_seconds label
+PARSE_STAGES = ['parse_seasons', 'parse_team_pages', 'stream']  # stages the pool works in
+
+
+class IncompleteScrapeError(Exception):
+    ''' A run that lost pages, exporting it would replace good data with less '''
+
+
+def check_years(start_year, end_year) -> tuple[int]:
+    try:
+        start_year = int(start_year)
+        end_year = int(end_year)
+    except ValueError:
+        raise TypeError(f'Invalid arguments: {start_year} or {end_year} are not numbers.')
+
+    if not start_year or not end_year:
+        log.info('No arguments provided, using default values.')
+    elif ((start_year < 1970) or (end_year > 2021)):
+        raise ValueError(f'Please input years between 1970 and 2021.')
+    return start_year, end_year
 
-    def end_timer_no_print(self):
-        end = time.time()
-        time_elapsed = end - self.start
-        time_elapsed_formated = round(time_elapsed, 3)
-        return time_elapsed_formated
 
 class AsyncNFLSS:
 
+    parse_version = 4  # bump when parsed results change shape, invalidates cached results
+
+    # low memory mode: peak RSS target is < 1 GB for a full 1970-2021 scrape,
+    # roughly 150 MB for the parent plus ~150 MB per worker parsing a season page
+    low_memory_workers = 4
+    low_memory_pending_pages = 8  # raw pages downloaded but not yet parsed
+    low_memory_tasks_per_worker = 50  # recycle workers, soups leave their heap fragmented
+    record_queue_size = 1000  # iter_records: records waiting for the consumer, the fetches wait beyond that
+
     def __init__(
         self, start_year:int, end_year:int,
         export_data: bool, export_stat: bool,
         export_schedule: bool, export_pickle: bool,
-        max_workers: int=None
+        max_workers: int=None, export_parquet: bool=False, page_cache: PageCache=None,
+        revalidate: bool=False, stream: bool=False,
+        low_memory: bool=False, parser: str='bs4',
+        targeted: bool=False, previous_export: str=None,
+        fetcher: FetchScheduler=None, resume: bool=False,
+        export_merge: bool=False, base_url: str=None,
+        profile_dir: str=None, export_sqlite: bool=False,
+        use_executor: bool=False, parse_window: int=None
     ):
-        self.base_url = r'https://www.pro-football-reference.com'
+        # another base_url serves the same pages from elsewhere, e.g. benchmark/fixture_server.py
+        self.base_url = base_url or r'https://www.pro-football-reference.com'
         self.season_url = self.base_url + r'/years/{}/'
-        # check year args
-        try:
-            start_year = int(start_year)
-            end_year = int(end_year)
-        except ValueError:
-            raise TypeError(f'Invalid arguments: {start_year} or {end_year} are not numbers.')
-
-        if not start_year or not end_year:
-            print('No arguments provided, using default values.')
-        elif ((start_year < 1970) or (end_year > 2021)):
-            raise ValueError(f'Please input years between 1970 and 2021.')
-
-        self.start_year = start_year
-        self.end_year = end_year
+        self.start_year, self.end_year = check_years(start_year, end_year)
 
         # export stuff
         self.export_filename = os.path.join('data', f'{self.start_year}-{self.end_year}')
@@ -67,6 +167,11 @@ class AsyncNFLSS:
         self.export_stat = export_stat
         self.export_schedule = export_schedule
         self.export_pickle = export_pickle
+        self.export_parquet = export_parquet
+        self.export_merge = export_merge
+        self.export_sqlite = export_sqlite
+        if export_parquet and pa is None:
+            raise ImportError('Parquet export needs pyarrow, install it with: pip install pyarrow')
 
         if os.name == 'nt':  # windows
             self.encoding = 'ANSI'
@@ -75,256 +180,611 @@ class AsyncNFLSS:
             self.encoding = 'latin-1'
 
         self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.parser = PARSERS[parser](self.base_url, targeted)
+        self.page_cache = page_cache
+        self.revalidate = revalidate
+        self.stream = stream or low_memory or use_executor  # only the pipeline can bound the pages in memory
+        self.low_memory = low_memory
+        if low_memory:
+            self.max_workers = min(self.max_workers, self.low_memory_workers)
+        # -executor: pages go to a ProcessPoolExecutor through run_in_executor, at most
+        # parse_window of them between download and parsed (backpressure on the fetches)
+        self.use_executor = use_executor
+        self.parse_window = parse_window or 2 * self.max_workers
 
-    def setup(self):
-        self.season_data = defaultdict(dict)
+        self.previous_export = previous_export  # export prefix or 'auto', incremental mode
+        self.fetcher = fetcher or FetchScheduler()
+        self.metrics = self.fetcher.metrics  # shared with the fetcher, written with -metrics
+        self.resume = resume
+        self.journal = CheckpointJournal(self.export_filename + '_checkpoint.sqlite', self.parse_version)
+        self.schema = StatSchema()  # stats are typed in the workers, see stat_schema.py
+        self.pool = None
+        self.executor = None
+        self.parse_queue = 0  # pages sent to the pool, not parsed yet
+        self.profile_dir = profile_dir  # -profile, profiles of run() and of every pool worker
+
+    def setup(self, journal: bool = True):
+        self.season_data = ColumnarTable(['year', 'team'], self.schema)
         self.season_html = {}
+        self.cached_season_results = {}
         
-        self.stat_descriptions = []
+        self.stat_registry = StatRegistry()
         
-        self.team_schedules = defaultdict(dict)
+        self.team_schedules = ColumnarTable(['year', 'team', 'week_number'], self.schema)
         self.team_html = {}
+        self.cached_team_results = []
         self.team_links = defaultdict(dict)
+        self.page_slots = None
+        self.records = None  # iter_records' queue, parsed pages go there instead of the tables
+        self.record_games = True
+        self.failed_pages = {}  # url: reason, pages that ran out of retries
+
+        self.scrape_plan = None  # None = scrape everything
+        self.manifest_years = {}
+        if self.previous_export:
+            self.load_previous_export()
 
-        self.tables_to_extract = [
-            'all_AFC', 'all_NFC', 'all_team_stats', 'all_passing',
-            'all_rushing', 'all_returns', 'all_kicking',
-            'all_team_scoring', 'all_team_conversions', 'all_drives'
+        self.resumed_years = set()
+        self.resumed_teams = set()
+        if self.resume:
+            self.load_checkpoint()
+        if journal:
+            self.journal.start(self.resume)
+
+    def load_previous_export(self):
+        ''' Reuses the rows of a previous export, plans what is still missing '''
+        prefix = self.previous_export
+        if prefix == 'auto':
+            prefix = find_previous_export(os.path.dirname(self.export_filename))
+        season_df = read_export(prefix) if prefix else None
+        if season_df is None:
+            log.info('No previous export found, scraping everything')
+            return
+
+        schedule_df = read_export(prefix, '_team_schedule')
+        manifest = read_manifest(prefix)
+        years = set(range(self.start_year, self.end_year + 1))
+        plan = plan_scrape(sorted(years), season_df, schedule_df, manifest, self.is_final_season)
+        self.scrape_plan = plan
+
+        # exports older than _schema.json hold the site's text (overtime 'OT' / missing), typed here
+        convert = None if os.path.exists(prefix + '_schema.json') else self.schema.convert
+        reused_seasons = season_df['year'].isin(years) & ~season_df['year'].isin(list(plan))
+        self.season_data.extend_frame(season_df[reused_seasons], convert)
+        if schedule_df is not None:
+            reused_games = [
+                year in years and (year not in plan or team in plan[year])
+                for year, team in zip(schedule_df['year'], schedule_df['team'])
+            ]
+            self.team_schedules.extend_frame(schedule_df[reused_games], convert)
+        if not self.stat_registry.read(prefix + '_stat_registry.json'):
+            self.stat_registry.add_descriptions(read_stat_descriptions(prefix))  # exported before the registry
+
+        for year in years - set(plan):
+            self.manifest_years[str(year)] = manifest['years'].get(str(year)) or {
+                'scraped_at': None,  # unknown, exported before manifests existed
+                'final': self.is_final_season(year),
+                'teams': sorted(set(schedule_df.loc[schedule_df['year'] == year, 'team']))
+                         if schedule_df is not None else [],
+            }
+
+        log.info(f'Reusing {len(years) - len(plan)} seasons from {prefix}, scraping {len(plan)}')
+
+    def load_checkpoint(self):
+        ''' Adds the pages parsed by an interrupted run, they won't be scraped again '''
+        for kind, year, team_name, result in self.journal.read():
+            if kind == 'season':
+                self.add_season_result(result)
+                self.resumed_years.add(year)
+            else:
+                self.add_team_result(result)
+                self.resumed_teams.add((year, team_name))
+        log.info(f'Resuming with {len(self.resumed_years)} seasons and {len(self.resumed_teams)} team pages already done')
+
+    def years_to_scrape(self):
+        years = [
+            year for year in range(self.end_year, self.start_year - 1, -1)
+            if year not in self.resumed_years
         ]
+        if self.scrape_plan is None:
+            return years
+        return [year for year in years if year in self.scrape_plan]
+
+    def wants_team_page(self, year, team_name):
+        if (year, team_name) in self.resumed_teams:
+            return False
+        return self.scrape_plan is None or team_name not in self.scrape_plan[year]
+
+    def is_final_season(self, year):
+        ''' Seasons end in February, after that their pages never change '''
+        today = time.localtime()
+        current_season = today.tm_year if today.tm_mon >= 3 else today.tm_year - 1
+        return year < current_season
+
+    async def fetch_page(self, url, year):
+        ''' Returns url's html and whether it is the same as the cached page '''
+        page = None
+        headers = {}
+        if self.page_cache is not None:
+            page = self.page_cache.get(url, ignore_ttl=True)
 
-    async def fetch_season_page(self, session, year):
-        print(f'\tFetching {year} season')
+        if page is not None:
+            fresh = self.is_final_season(year) or not self.page_cache.is_expired(page.fetched_at)
+            if fresh and not self.revalidate:
+                return page.body.decode(self.encoding), True
+
+            # conditional GET, the server only sends the page again if it changed
+            if page.etag:
+                headers['If-None-Match'] = page.etag
+            if page.last_modified:
+                headers['If-Modified-Since'] = page.last_modified
+
+        r = await self.fetcher.fetch(url, headers)
+        if r.status == 304 and page is not None:
+            self.page_cache.touch(url)
+            return page.body.decode(self.encoding), True
+
+        if self.page_cache is not None:
+            self.page_cache.put(
+                url, r.body, r.headers.get('ETag'),
+                r.headers.get('Last-Modified'), self.encoding
+            )
+        return r.body.decode(self.encoding), False
+
+    async def try_fetch_page(self, url, year):
+        ''' Like fetch_page, a page that can't be fetched is recorded instead of raising '''
+        try:
+            return await self.fetch_page(url, year)
+        except FetchError as error:
+            log.warning(f'\tGiving up on {error}')
+            self.failed_pages[url] = error.reason
+            return None, False
+
+    def get_cached_result(self, url, from_cache):
+        ''' Parsed result of an unchanged page, None if it has to be parsed '''
+        if not from_cache:
+            return None
+        result = self.page_cache.get_parsed(url, self.parse_version)
+        if result is not None:
+            self.metrics.count('parses_skipped')
+        return result
+
+    def cache_result(self, url, result):
+        if self.page_cache is not None:
+            self.page_cache.put_parsed(url, result, self.parse_version)
+
+    async def fetch_season_page(self, year):
+        log.debug(f'\tFetching {year} season')
         url = self.season_url.format(year)
-        r = await session.request(method='GET', url=url)
-        r.raise_for_status()  # not sure what this does
-        html = await r.text(encoding=self.encoding)
-        self.season_html[year] = html
-        # return html
+        html, from_cache = await self.try_fetch_page(url, year)
+        if html is None:
+            return
+        result = self.get_cached_result(url, from_cache)
+        if result is None:
+            self.season_html[year] = html
+        else:
+            log.debug(f'\t{year} season unchanged, skipping parse')
+            self.cached_season_results[year] = result
 
     async def fetch_all_seasons(self):
-        print('Fetching season pages')
+        log.info('Fetching season pages')
         tasks = []
-        connector = aiohttp.TCPConnector(limit=10)  # avoid spamming the target
-        async with aiohttp.ClientSession(connector=connector) as session:
-            for year in range(self.end_year, self.start_year - 1, -1):
-                tasks.append(
-                    self.fetch_season_page(session, year)
-                )
-            # print('Done')
-            return await asyncio.gather(*tasks)
+        for year in self.years_to_scrape():
+            tasks.append(
+                self.fetch_season_page(year)
+            )
+        # print('Done')
+        return await asyncio.gather(*tasks)
 
-    async def fetch_team_page(self, session, url, team_name, year):
-        print(f'\tFetching {url}')
-        r = await session.request(method='GET', url=url)
-        r.raise_for_status()
-        html = await r.text(encoding=self.encoding)
-        self.team_html[year][team_name] = html
-        print(f'\tDone fetching {url}')
+    async def fetch_team_page(self, url, team_name, year):
+        log.debug(f'\tFetching {url}')
+        html, from_cache = await self.try_fetch_page(url, year)
+        if html is None:
+            return
+        result = self.get_cached_result(url, from_cache)
+        if result is None:
+            self.team_html[year][team_name] = html
+        else:
+            self.cached_team_results.append(result)
+        log.debug(f'\tDone fetching {url}')
 
     async def fetch_all_team_pages(self):
-        print(f'Fetching team pages')
+        log.info('Fetching team pages')
         tasks = []
-        connector = aiohttp.TCPConnector(limit=10)  # avoid spamming the target
-        async with aiohttp.ClientSession(connector=connector) as session:
-            for year in self.team_links.keys():
-                self.team_html[year] = {}
-                print(year)
-                for team_name, team_url in self.team_links[year].items():
-                    tasks.append(
-                        self.fetch_team_page(session, team_url, team_name, year)
-                    )
-            return await asyncio.gather(*tasks)
-
-    def get_team_page_links(self, html, year):
-        soup = bs4.BeautifulSoup(html, 'html.parser')
-        team_page_links = soup.find_all('a')  # individual team page
-        links = {}
-        for link in team_page_links:
-            team_name = link.text
-            url = self.base_url + link.attrs['href']
-            links[team_name] = url
-        return links
-
-    def uncomment_table(self, html):
-        # uncomment all html code, needed for some tables
-        for comment in html(text=lambda text: isinstance(text, bs4.Comment)):
-            tag = bs4.BeautifulSoup(comment, 'html.parser')
-            comment.replace_with(tag)
-
-        return html
-        
-    def extract_data_from_table(self, table_html: bs4.element.Tag):           
-        tbody = table_html.find('tbody')
-        season_data = {}
-        for row in tbody.find_all('tr', {'class': ''}):
-            team_name = row.find(attrs={'data-stat': 'team'}).text
-            team_name = team_name.replace('*', '').replace('+', '')
-            current_team = {}
-
-            # season stats
-            for col in row.find_all('td'):
-                stat_name = col['data-stat']
-                stat_value = col.text
-                current_team[stat_name] = stat_value
-
-            season_data[team_name] = current_team
-        return season_data
-
-    def extract_stat_descriptions(
-        self, table_html: bs4.element.Tag, 
-        html_tag: str = 'th', html_class: dict = None
-        ) -> list[tuple[str]]:
-        # stat_headers = table_html.find_all('th', {'class': 'poptip'})
-        stat_headers = table_html.find_all(html_tag, html_class)
-        descriptions = []
-        re_pattern = re.compile('(<.+?>)')
-        for header in stat_headers:
-            stat_name = re_pattern.sub('', header.attrs.get('data-stat') or 'NULL')
-            label = re_pattern.sub('', header.attrs.get('aria-label') or 'NULL')
-            tip = re_pattern.sub('', header.attrs.get('data-tip') or 'NULL')
-
-            descriptions.append((stat_name, label, tip))
-
-        return descriptions
-
-    def process_season_soup(self, args):
-        year, html = args
-        print(f'\tProcessing {year} season')
-        soup = bs4.BeautifulSoup(html, 'html.parser')
-        links_html = ''
-        season_data = defaultdict(defaultdict)
-        stat_descriptions = []
-        for table_id in self.tables_to_extract:
-            table_html = soup.find('div', {'class': 'table_wrapper',
-                                           'id': table_id})
-            if table_html is None:
-                continue
-            table_html = self.uncomment_table(table_html)
-
-            table_data = self.extract_data_from_table(table_html)
-            stat_descriptions += self.extract_stat_descriptions(table_html, 'th', {'class': 'poptip'})
-            if table_id in ['all_AFC', 'all_NFC']:
-                links_html += str(table_html)
-
-            for team_name, team_stats in table_data.items():
-                season_data[team_name] = season_data[team_name] | team_stats
-        links = self.get_team_page_links(links_html, year)
-
-        print(f'Done processing {year} season')
-        season_dict = {year: {'season_data': season_data, 'team_links': links}}
-        return season_dict, stat_descriptions
+        for year in self.team_links.keys():
+            self.team_html[year] = {}
+            log.debug(year)
+            for team_name, team_url in self.team_links[year].items():
+                if not self.wants_team_page(year, team_name):
+                    continue
+                tasks.append(
+                    self.fetch_team_page(team_url, team_name, year)
+                )
+        return await asyncio.gather(*tasks)
 
     def process_all_seasons(self):
-        print('Processing season pages')
-        timer = CustomTimer()
-        tasks = []
-        for year, html in self.season_html.items():
-            tasks.append((year, html))
+        log.info('Processing season pages')
+        with self.metrics.stage('parse_seasons', 'Done processing season pages'):
+            self.parse_all_seasons()
 
-        with multiprocessing.Pool(self.max_workers) as pool:
-            results = pool.map(self.process_season_soup, tasks)
+    def parse_all_seasons(self):
+        # (year, html) popped as the pool sends them, a page's html is dropped once a worker has it
+        count = len(self.season_html)
+        tasks = (self.season_html.popitem() for _ in range(count))
+        for season in self.parse_all(process_season_soup, tasks, count):
+            season = self.register_descriptions(season)
+            year = next(iter(season[0]))
+            self.cache_result(self.season_url.format(year), season)
+            self.record_season_result(season)
 
-        for season in results:
-            season_data = season[0]
-            for year in season_data.keys():
-                self.season_data[year] = season_data[year]['season_data']
-                self.team_links[year] = season_data[year]['team_links']
+        for season in self.cached_season_results.values():
+            self.record_season_result(season)
 
-            stat_descriptions = season[1]
-            self.stat_descriptions += stat_descriptions
-        
-        self.stat_descriptions = list(set(self.stat_descriptions))
-        print(f'Done processing season pages in {timer.end_timer_no_print()}s')
-
-    def process_team_page(self, args):
-        html, team_name, year = args
-        soup = bs4.BeautifulSoup(html, 'html.parser')
-        table = soup.find('table', {'id': 'games'})
-        tbody = table.find('tbody')
-        team_schedule = {}
-        stat_descriptions = self.extract_stat_descriptions(tbody, 'td')
-        # games in season
-        for irow, row in enumerate(tbody.find_all('tr', {'class': ''})):
-            row_stats = {}
-            # game stats
-            for col in row.find_all('td'):  # each column in current row
-                stat_name = col['data-stat']  # stat name
-                stat_value = col.text
-                row_stats[stat_name] = stat_value
-
-            row_stats['week_num'] = row.find('th', {'data-stat': 'week_num'}).text
-            team_schedule[irow] = row_stats
-            
-        print(f'Done processing {team_name} {year} team page.')
-        season_dict = {year: {team_name: team_schedule}}
-        return season_dict, stat_descriptions
+    def record_season_result(self, season):
+        ''' Adds a season that was just parsed (or read from the page cache) and journals it '''
+        year = next(iter(season[0]))
+        self.journal.add('season', year, None, season)
+        self.add_season_result(season)
+
+    def add_season_result(self, season):
+        season_data = season[0]
+        for year in season_data.keys():
+            self.season_data.extend_batch((year,), season_data[year]['season_data'])
+            self.team_links[year] = season_data[year]['team_links']
+            self.stat_registry.add_page(year, season[1])
 
     def process_all_team_pages(self):
-        timer = CustomTimer()
-        print('Processing team pages')
-        tasks = []
-        for year in self.team_html.keys():
-            self.team_schedules[year] = {}
-            for team_name, team_html in self.team_html[year].items():
-                tasks.append((team_html, team_name, year))
-
-        with multiprocessing.Pool(self.max_workers) as pool:
-            results = pool.map(self.process_team_page, tasks)
-
-        # for res in results:
-        #     for year in res.keys():
-        #         for team in res[year].keys():
-        #             self.team_schedules[year][team] = res[year][team]
-        for season in results:
-            season_data = season[0]
-            for year in season_data.keys():
-                for team in season_data[year]:
-                    self.team_schedules[year][team] = season_data[year][team]
-
-            stat_descriptions = season[1]
-            self.stat_descriptions += stat_descriptions
-        
-        self.stat_descriptions = list(set(self.stat_descriptions))
+        log.info('Processing team pages')
+        with self.metrics.stage('parse_team_pages', 'Done processing team pages'):
+            self.parse_all_team_pages()
+
+    def pop_team_pages(self):
+        ''' (html, team_name, year) tasks, each page removed from team_html as it is taken '''
+        for year, pages in self.team_html.items():
+            while pages:
+                team_name, team_html = pages.popitem()
+                yield team_html, team_name, year
+
+    def parse_all_team_pages(self):
+        count = sum(len(pages) for pages in self.team_html.values())
+        for season in self.parse_all(process_team_page, self.pop_team_pages(), count):
+            season = self.register_descriptions(season)
+            year = next(iter(season[0]))
+            team_name = next(iter(season[0][year]))
+            self.cache_result(self.team_links[year][team_name], season)
+            self.record_team_result(season)
+        self.team_html.clear()
+
+        for season in self.cached_team_results:
+            self.record_team_result(season)
+
+    def record_team_result(self, season):
+        year = next(iter(season[0]))
+        self.journal.add('team', year, next(iter(season[0][year])), season)
+        self.add_team_result(season)
+
+    def add_team_result(self, season):
+        season_data = season[0]
+        for year in season_data.keys():
+            for team, team_schedule in season_data[year].items():
+                self.team_schedules.extend_batch((year, team), team_schedule)
+            self.stat_registry.add_page(year, season[1])
+
+    def register_descriptions(self, result):
+        ''' A worker's result with the descriptions it sent earlier filled in, before it is cached or journaled '''
+        year = next(iter(result[0]))
+        return result[0], self.stat_registry.add_page(year, result[1])
+
+    @property
+    def stat_descriptions(self) -> list[tuple[str]]:
+        return self.stat_registry.descriptions()
+
+    def get_pool(self):
+        ''' Worker pool, started on first use and kept for the whole run '''
+        if self.pool is None:
+            maxtasksperchild = self.low_memory_tasks_per_worker if self.low_memory else None
+            log_level = logging.getLevelName(log.getEffectiveLevel())
+            self.pool = multiprocessing.Pool(
+                self.max_workers, initializer=init_worker, initargs=(self.parser, self.schema, log_level, self.profile_dir),
+                maxtasksperchild=maxtasksperchild
+            )
+        return self.pool
+
+    def get_executor(self):
+        ''' ProcessPoolExecutor of -executor, started on first use, workers set up like the pool's '''
+        if self.executor is None:
+            options = {}
+            if self.low_memory and sys.version_info >= (3, 11):
+                options['max_tasks_per_child'] = self.low_memory_tasks_per_worker
+            log_level = logging.getLevelName(log.getEffectiveLevel())
+            self.executor = ProcessPoolExecutor(
+                self.max_workers, initializer=init_worker,
+                initargs=(self.parser, self.schema, log_level, self.profile_dir), **options
+            )
+        return self.executor
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def parse_all(self, parse, tasks, count: int):
+        ''' Parses count tasks in the pool, yields results as they finish
 
+        tasks is consumed lazily, by the pool's task thread as it sends them
+        to the workers, the parent doesn't keep the pages of sent tasks.
+        '''
+        if not count:
+            return
+        # a few chunks per worker, big enough to amortize IPC, small enough to balance
+        chunksize = max(1, count // (self.max_workers * 4))
+        timed_tasks = ((parse, task) for task in tasks)
+        self.metrics.set_gauge('parse_queue', count)
+        for queued, (result, seconds, pid) in enumerate(
+            self.get_pool().imap_unordered(timed_parse, timed_tasks, chunksize)
+        ):
+            self.record_parse(parse, seconds, pid)
+            self.metrics.set_gauge('parse_queue', count - queued - 1)
+            yield result
+
+    def parse_in_pool(self, parse, task):
+        ''' Sends task to the pool, returns an awaitable for its result '''
+        if self.use_executor:
+            return self.parse_in_executor(parse, task)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.parse_queue += 1
+        self.metrics.set_gauge('parse_queue', self.parse_queue)
+        self.get_pool().apply_async(
+            timed_parse, ((parse, task),),
+            callback=lambda result: loop.call_soon_threadsafe(self.parse_done, future, parse, result),
+            error_callback=lambda error: loop.call_soon_threadsafe(self.parse_done, future, parse, error)
+        )
+        return future
+
+    async def parse_in_executor(self, parse, task):
+        loop = asyncio.get_running_loop()
+        self.parse_queue += 1
+        self.metrics.set_gauge('parse_queue', self.parse_queue)
+        try:
+            result, seconds, pid = await loop.run_in_executor(self.get_executor(), timed_parse, (parse, task))
+        finally:
+            self.parse_queue -= 1
+            self.metrics.set_gauge('parse_queue', self.parse_queue)
+        self.record_parse(parse, seconds, pid)
+        return result
 
-        print(f'Done processing team pages in {timer.end_timer_no_print()}s')
+    def parse_done(self, future, parse, result):
+        ''' Pool callback, on the event loop '''
+        self.parse_queue -= 1
+        self.metrics.set_gauge('parse_queue', self.parse_queue)
+        if future.cancelled():  # iter_records stopped early
+            return
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+            return
+        result, seconds, pid = result
+        self.record_parse(parse, seconds, pid)
+        future.set_result(result)
 
-    def run_fetch_all_seasons(self):
-        timer = CustomTimer()
-        asyncio.run(self.fetch_all_seasons())
-        print(f'Done fetching season pages in {timer.end_timer_no_print()}s')
+    def record_parse(self, parse, seconds: float, pid: int):
+        self.metrics.observe('parse_seconds', seconds, PARSE_BUCKETS, page=PAGE_KINDS[parse])
+        self.metrics.count('worker_busy_seconds', seconds, worker=pid)
 
-    def run_fetch_all_team_pages(self):
-        timer = CustomTimer()
-        asyncio.run(self.fetch_all_team_pages())
-        print(f'Done fetching team pages in {timer.end_timer_no_print()}s')
+    def record_worker_utilization(self):
+        ''' Share of the parsing stages' wall time the pool workers spent parsing '''
+        stage_seconds = sum(self.metrics.get('stage_seconds', stage=stage) for stage in PARSE_STAGES)
+        if stage_seconds:
+            busy_seconds = self.metrics.total('worker_busy_seconds')
+            self.metrics.set_gauge('worker_utilization', round(busy_seconds / (self.max_workers * stage_seconds), 4))
+
+    async def stream_page(self, url, year, parse, make_task):
+        ''' Fetches url and parses it as soon as it arrives '''
+        if self.page_slots is None:
+            return await self.fetch_and_parse(url, year, parse, make_task)
+
+        # low memory mode, a page holds a slot from download until it is parsed
+        async with self.page_slots:
+            return await self.fetch_and_parse(url, year, parse, make_task)
+
+    async def fetch_and_parse(self, url, year, parse, make_task):
+        ''' Parsed result of url, None if it couldn't be fetched '''
+        html, from_cache = await self.try_fetch_page(url, year)
+        if html is None:
+            return None
+        result = self.get_cached_result(url, from_cache)
+        if result is None:
+            result = self.register_descriptions(await self.parse_in_pool(parse, make_task(html)))
+            self.cache_result(url, result)
+        return result
+
+    async def stream_season(self, year):
+        log.debug(f'\tFetching {year} season')
+        url = self.season_url.format(year)
+        result = await self.stream_page(
+            url, year, process_season_soup, lambda html: (year, html)
+        )
+        if result is None:
+            return
+        if self.records is None:
+            self.record_season_result(result)
+        else:
+            self.team_links[year] = result[0][year]['team_links']
+            await self.put_records(season_records(result))
+            if not self.record_games:
+                return
+
+        # team pages are queued as soon as their links are known
+        await self.stream_team_pages(year)
+
+    async def stream_team_pages(self, year):
+        await asyncio.gather(*[
+            self.stream_team_page(team_url, team_name, year)
+            for team_name, team_url in self.team_links[year].items()
+            if self.wants_team_page(year, team_name)
+        ])
+
+    async def stream_team_page(self, url, team_name, year):
+        log.debug(f'\tFetching {url}')
+        result = await self.stream_page(
+            url, year, process_team_page,
+            lambda html: (html, team_name, year)
+        )
+        if result is None:
+            return
+        if self.records is None:
+            self.record_team_result(result)
+        else:
+            await self.put_records(game_records(result))
+
+    async def put_records(self, records: list):
+        for record in records:
+            await self.records.put(record)
+
+    async def stream_all(self):
+        ''' Fetch -> parse pipeline, network and pool workers run at the same time '''
+        log.info('Streaming season and team pages')
+        if self.low_memory:
+            self.page_slots = asyncio.Semaphore(self.low_memory_pending_pages)
+        elif self.use_executor:
+            self.page_slots = asyncio.Semaphore(self.parse_window)
+
+        await asyncio.gather(
+            *[self.stream_season(year) for year in self.years_to_scrape()],
+            # seasons done before -resume, some of their team pages may be missing
+            *[self.stream_team_pages(year) for year in self.resumed_years]
+        )
+
+        self.page_slots = None
+
+    async def run_stream(self):
+        with self.metrics.stage('stream', 'Done fetching and processing all pages'):
+            await self.stream_all()
+
+    async def run_fetch_all_seasons(self):
+        with self.metrics.stage('fetch_seasons', 'Done fetching season pages'):
+            await self.fetch_all_seasons()
+
+    async def run_fetch_all_team_pages(self):
+        with self.metrics.stage('fetch_team_pages', 'Done fetching team pages'):
+            await self.fetch_all_team_pages()
+
+    async def scrape(self):
+        ''' Every stage on one event loop, sharing the fetcher's session and connections '''
+        async with self.fetcher:
+            if self.stream:
+                await self.run_stream()
+                return
+            await self.run_fetch_all_seasons()
+            self.process_all_seasons()  # blocks the loop, nothing is in flight meanwhile
+            await self.run_fetch_all_team_pages()
+            self.process_all_team_pages()
 
     def run(self):
-        self.setup()
         if os.name == 'nt':
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        self.run_fetch_all_seasons()
-        self.process_all_seasons()
-        self.run_fetch_all_team_pages()
-        self.process_all_team_pages()
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        ''' run() for callers that already have an event loop, e.g. an asyncio service
+
+        Nothing here blocks the loop for long: with -executor (or -stream) pages
+        are parsed while the other downloads go on, and the workers are shut
+        down from a thread.
+        '''
+        self.setup()
+        profiler = None
+        if self.profile_dir:
+            clear_profiles(self.profile_dir)
+            profiler = Profiler()
+            profiler.enable()
+        try:
+            await self.scrape()
+        finally:
+            # workers save their profiles when they exit
+            await asyncio.get_running_loop().run_in_executor(None, self.close_pool)
+            self.journal.close()
+            if profiler is not None:
+                profiler.disable()
+                profiler.save(os.path.join(self.profile_dir, 'main'))
+                log.info(f'Profile saved to {combine_profiles(self.profile_dir)}')
+        self.record_worker_utilization()
+        self.report_failures()
+
+    async def iter_records(self, start_year: int = None, end_year: int = None, seasons: bool = True, games: bool = True):
+        ''' SeasonRecords and GameRecords, each page's as soon as it is parsed
+
+            async for record in scraper.iter_records(2019, 2021):
+                await sink.write(record)
+
+        Streams like -stream (or -executor) but keeps nothing: the records only
+        go to the consumer, and the fetches wait while it is record_queue_size
+        records behind. No checkpoint or export is written, failed pages are in
+        failed_pages afterwards. A consumer that stops early should close the
+        generator (contextlib.aclosing) to stop the fetches and workers right away.
+        '''
+        if start_year is not None:
+            self.start_year, self.end_year = check_years(start_year, end_year or start_year)
+        self.setup(journal=False)
+        self.records = asyncio.Queue(self.record_queue_size)
+        self.record_games = games
+        scrape = asyncio.create_task(self.scrape_records())
+        try:
+            while True:
+                record = await self.records.get()
+                if record is None:
+                    break
+                if seasons or not isinstance(record, SeasonRecord):
+                    yield record
+            await scrape  # raises what the scrape raised
+        finally:
+            if not scrape.done():  # the consumer stopped early
+                scrape.cancel()
+                await asyncio.gather(scrape, return_exceptions=True)
+            await asyncio.get_running_loop().run_in_executor(None, self.close_pool)
+            self.records = None
+        self.report_failures()
+
+    async def scrape_records(self):
+        try:
+            async with self.fetcher:
+                await self.run_stream()
+        except asyncio.CancelledError:
+            raise  # the consumer is gone, nobody waits for the end
+        except Exception:
+            await self.records.put(None)
+            raise
+        await self.records.put(None)  # end of the records
+
+    def iter_team_games(self, start_year: int = None, end_year: int = None):
+        ''' GameRecords of every team page, see iter_records '''
+        return self.iter_records(start_year, end_year, seasons=False)
+
+    def iter_seasons(self, start_year: int = None, end_year: int = None):
+        ''' SeasonRecords, only the season pages are fetched '''
+        return self.iter_records(start_year, end_year, games=False)
+
+    def report_failures(self):
+        if self.fetcher.retry_count:
+            log.warning(f'Retried {self.fetcher.retry_count} requests')
+        if not self.failed_pages:
+            return
+        # left out of the export and the manifest, an -incremental run picks them up again
+        log.warning(f'Could not fetch {len(self.failed_pages)} pages:')
+        for url, reason in self.failed_pages.items():
+            log.warning(f'\t{url} ({reason})')
 
     def dump_team_schedules(self):
         ''' Dumps all teams schedules to a CSV file '''
         local_filename = self.export_filename + '_team_schedule.csv'
-        print(f'Team schedules saved to {local_filename}')
-
-        reoriented_data = {
-            (i, j, k): self.team_schedules[i][j][k]
-                    for i in self.team_schedules.keys()
-                    for j in self.team_schedules[i].keys()
-                    for k in self.team_schedules[i][j].keys()
-        }
-        df = pd.DataFrame.from_dict(reoriented_data, orient='index').reset_index() \
-            .rename(
-                {'level_0': 'year',
-                 'level_1': 'team',
-                 'level_2': 'week_number'}, axis=1
-            )
+        log.info(f'Team schedules saved to {local_filename}')
+
+        df = self.team_schedules.to_frame()
         df.to_csv(local_filename, sep=';', encoding='utf-8', index=True)
 
     def dump_stat_descriptions(self):
@@ -335,34 +795,125 @@ class AsyncNFLSS:
             writer.writerow(('stat_name', 'label', 'tip'))  # header
             writer.writerows(self.stat_descriptions)
 
-        
-        print('Exported stat descriptions to', local_filename)
+        self.stat_registry.write(self.export_filename + '_stat_registry.json')
+        for table_id, year, added, removed in self.stat_registry.schema_changes():
+            log.info(f'\tThe {table_id} table changed in {year}: added {added}, removed {removed}')
+        log.info(f'Exported stat descriptions to {local_filename}')
 
     def dump_to_csv(self):
         ''' Dumps season data do CSV file '''
         filename = self.export_filename + '.csv'
-        reoriented_data = {
-            (i, j): self.season_data[i][j]
-                    for i in self.season_data.keys()
-                    for j in self.season_data[i].keys()
-        }
-        df = pd.DataFrame.from_dict(reoriented_data, orient='index').reset_index() \
-            .rename(
-                {'level_0': 'year',
-                 'level_1': 'team'}, axis=1
-            )
+        df = self.season_data.to_frame()
         df.to_csv(filename, sep=';', encoding='utf-8', index=True)
-        print('Exported season data to', filename)
+        log.info(f'Exported season data to {filename}')
+
+    def dump_schema(self):
+        ''' Type, label and tip of every exported column, read back by -incremental '''
+        filename = self.export_filename + '_schema.json'
+        tables = {'season': self.season_data}
+        if self.export_schedule:
+            tables['team_schedule'] = self.team_schedules
+        write_schema(filename, describe_columns(tables, self.stat_descriptions))
+        log.info(f'Exported column schema to {filename}')
 
     def dump_to_pickle(self):
         local_filename = self.export_filename + '.pickle'
         with open(local_filename, 'wb') as file:
-            pickle.dump((self.team_schedules, self.season_data), file)
+            pickle.dump((self.team_schedules.to_nested(), self.season_data.to_nested()), file)
+
+    def write_parquet_dataset(self, table: ColumnarTable, path: str):
+        # category stats (team, opp...) are stored as dictionary columns, read back as categoricals
+        df = table.to_frame(unique_names=True)
+        if os.path.exists(path):  # write_to_dataset adds files, it doesn't replace them
+            shutil.rmtree(path)
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_to_dataset(arrow_table, path, partition_cols=['year'])
+
+    def dump_to_parquet(self):
+        ''' Dumps season data and team schedules to Parquet datasets partitioned by year '''
+        filename = self.export_filename + '.parquet'
+        self.write_parquet_dataset(self.season_data, filename)
+        log.info(f'Exported season data to {filename}')
+
+        if self.export_schedule:
+            filename = self.export_filename + '_team_schedule.parquet'
+            self.write_parquet_dataset(self.team_schedules, filename)
+            log.info(f'Exported team schedules to {filename}')
+
+    def dump_to_sqlite(self):
+        ''' Season data, team schedules and stat descriptions in one indexed database, see query_store.py '''
+        filename = self.export_filename + '.sqlite'
+        schema = describe_columns(
+            {'season': self.season_data, 'team_schedule': self.team_schedules}, self.stat_descriptions
+        )
+        write_store(
+            filename,
+            self.season_data.to_frame(unique_names=True),
+            self.team_schedules.to_frame(unique_names=True),
+            self.stat_descriptions, schema
+        )
+        log.info(f'Exported SQLite store to {filename}')
+
+    def dump_merged_games(self, base_path: str = None, kaggle: bool = True):
+        ''' Merges the team schedules with the season stats in memory, no CSV round-trip '''
+        base_path = base_path or os.path.dirname(self.export_filename)
+        os.makedirs(base_path, exist_ok=True)
+        df_games = merge_games(
+            self.season_data.to_frame(unique_names=True),
+            self.team_schedules.to_frame(unique_names=True)
+        )
+        export_merged(df_games, base_path, kaggle)
+
+    def remove_checkpoint(self):
+        ''' Once the run is exported, unless pages failed: -resume then only fetches those '''
+        if not self.failed_pages:
+            self.journal.remove()
+
+    def dump_manifest(self):
+        ''' Records when each season was scraped, read back by incremental runs '''
+        now = time.time()
+        for year in self.team_links:
+            self.manifest_years[str(year)] = {
+                'scraped_at': now,
+                'final': self.is_final_season(year),
+                'teams': sorted(self.team_links[year]),
+            }
+        write_manifest(self.export_filename, self.manifest_years)
+
+    def existing_exports(self) -> list[str]:
+        ''' Files of a previous export this one would overwrite '''
+        paths = [
+            path for path in glob.glob(glob.escape(self.export_filename) + '*')
+            if not os.path.basename(path).startswith(os.path.basename(self.export_filename) + '_checkpoint')
+        ]
+        merged_path = os.path.join(os.path.dirname(self.export_filename), 'all_games.csv')
+        if self.export_merge and os.path.exists(merged_path):
+            paths.append(merged_path)
+        return paths
+
+    def check_complete(self, existing_paths: list[str]):
+        ''' Raises instead of exporting a run that got nothing, or replacing existing_paths with partial data
+
+        -incremental runs are let through, the failed pages are left out of
+        their manifest and scraped again by the next run.
+        '''
+        if not self.failed_pages:
+            return
+        if not len(self.season_data):
+            raise IncompleteScrapeError(f'None of the {len(self.failed_pages)} pages could be fetched, nothing was exported')
+        if existing_paths and not self.previous_export:
+            raise IncompleteScrapeError(
+                f'{len(self.failed_pages)} pages could not be fetched, not overwriting {", ".join(sorted(existing_paths))} '
+                'with partial data (run with -resume to fetch them, or -incremental to export anyway)'
+            )
 
     def export(self):
+        self.check_complete(self.existing_exports())
         if not os.path.exists(os.path.join('.', 'data')):
             os.makedirs(os.path.join('.', 'data'))
 
+        self.dump_manifest()
+
         if self.export_data:
             self.dump_to_csv()
 
@@ -372,15 +923,27 @@ class AsyncNFLSS:
         if self.export_pickle:
             self.dump_to_pickle()
 
+        if self.export_parquet:
+            self.dump_to_parquet()
+
         if self.export_stat:
             self.dump_stat_descriptions()
 
+        if self.export_sqlite:
+            self.dump_to_sqlite()
 
-if __name__ == '__main__':
-    timer = CustomTimer()
-    timer.start_timer()
-    # CLI args
-    parser = argparse.ArgumentParser(description='CLI Testing')
+        if self.export_data or self.export_schedule or self.export_parquet:
+            self.dump_schema()
+
+        if self.export_merge:
+            self.dump_merged_games()
+
+        self.remove_checkpoint()
+
+
+def build_arg_parser(description: str = 'CLI Testing') -> argparse.ArgumentParser:
+    ''' CLI options of the scraper, shared with pipeline.py '''
+    parser = argparse.ArgumentParser(description=description)
 
     # Required
     parser.add_argument('start_year', type=int, help='Initial year')
@@ -391,24 +954,111 @@ if __name__ == '__main__':
     parser.add_argument('-stat', action='store_true', help='Export stat descriptions')
     parser.add_argument('-ts', action='store_true', help='Export team schedules')
     parser.add_argument('-pickle', action='store_true', help='Export data as .pickle')
+    parser.add_argument('-parquet', action='store_true',
+                        help='Export data (and team schedules, with -ts) as Parquet, partitioned by year')
+    parser.add_argument('-sqlite', action='store_true',
+                        help='Export season data, team schedules and stat descriptions to an indexed SQLite file')
+    parser.add_argument('-merge', action='store_true',
+                        help='Merge games with both teams season stats (all_games.csv, playoffs.csv, kaggle files)')
+    parser.add_argument('-incremental', nargs='?', const='auto',
+                        help='Reuse a previous export (default = newest in ./data), only scrape what it is missing')
     parser.add_argument('-w', type=int, help='How many workers to use (default = cpu_count)')
-    args = vars(parser.parse_args())
-    
+    parser.add_argument('-cache', nargs='?', const=os.path.join('data', 'cache'),
+                        help='Cache downloaded pages (default dir = ./data/cache)')
+    parser.add_argument('-ttl', type=float, default=24,
+                        help='Hours before cached pages of the current season expire (default = 24)')
+    parser.add_argument('-cache_mb', type=int, default=512, help='Max page cache size in MB (default = 512)')
+    parser.add_argument('-revalidate', action='store_true',
+                        help='Check every cached page with the server (conditional GET), implies -cache')
+    parser.add_argument('-stream', action='store_true',
+                        help='Parse each page as soon as it is downloaded (fetch and parse overlap)')
+    parser.add_argument('-lowmem', action='store_true',
+                        help='Keep at most a few raw pages in memory, peak RSS < 1 GB (implies -stream)')
+    parser.add_argument('-parser', choices=list(PARSERS), default='bs4',
+                        help='HTML parser, lxml is several times faster (default = bs4)')
+    parser.add_argument('-executor', action='store_true',
+                        help='Parse in a ProcessPoolExecutor from the event loop, implies -stream')
+    parser.add_argument('-window', type=int,
+                        help='With -executor, pages downloaded but not parsed yet (default = 2 x workers)')
+    parser.add_argument('-targeted', action='store_true',
+                        help='Only parse the wanted tables instead of the whole page')
+    parser.add_argument('-rate', type=float, default=10,
+                        help='Max requests per second, lowered automatically when throttled (default = 10)')
+    parser.add_argument('-retries', type=int, default=5,
+                        help='Retries for failed requests (429, 5xx, network errors) (default = 5)')
+    parser.add_argument('-nocompress', action='store_true',
+                        help="Don't ask the server for gzip/deflate/br compressed pages")
+    parser.add_argument('-resume', action='store_true',
+                        help='Continue an interrupted run, pages it already parsed are not scraped again')
+    parser.add_argument('-log', choices=['debug', 'info', 'warning', 'error'], default='info',
+                        help='Messages shown, debug lists every page (default = info)')
+    parser.add_argument('-profile', nargs='?', const=os.path.join('data', 'profile'),
+                        help='Profile the run and every pool worker (default dir = ./data/profile)')
+    parser.add_argument('-metrics',
+                        help='Write the run metrics to this file, Prometheus text for .prom, JSON lines otherwise')
+    return parser
+
+
+def scraper_from_args(args: dict, **options) -> AsyncNFLSS:
+    ''' AsyncNFLSS set up from the parsed CLI options, keyword arguments override them '''
+    if args['revalidate'] and not args['cache']:
+        args['cache'] = os.path.join('data', 'cache')
+
+    page_cache = None
+    if args['cache']:
+        page_cache = PageCache(args['cache'], ttl=args['ttl'] * 3600, max_size=args['cache_mb'] * 1024 ** 2)
+
+    settings = dict(
+        start_year=args['start_year'],
+        end_year=args['end_year'],
+        export_data=args['o'],
+        export_stat=args['stat'],
+        export_schedule=args['ts'],
+        export_pickle=args['pickle'],
+        export_parquet=args['parquet'],
+        export_merge=args['merge'],
+        export_sqlite=args['sqlite'],
+        max_workers=args['w'],
+        page_cache=page_cache,
+        revalidate=args['revalidate'],
+        stream=args['stream'],
+        low_memory=args['lowmem'],
+        use_executor=args['executor'],
+        parse_window=args['window'],
+        parser=args['parser'],
+        targeted=args['targeted'],
+        previous_export=args['incremental'],
+        fetcher=FetchScheduler(
+            max_rate=args['rate'], retries=args['retries'],
+            compress=not args['nocompress']
+        ),
+        resume=args['resume'],
+        profile_dir=args['profile']
+    )
+    settings.update(options)
+    return AsyncNFLSS(**settings)
+
+
+if __name__ == '__main__':
+    timer = CustomTimer()
+    timer.start_timer()
+    # CLI args
+    args = vars(build_arg_parser().parse_args())
+    configure_logging(args['log'])
+
+    nfl = None
     try:
-        nfl = AsyncNFLSS(
-            start_year=args['start_year'],
-            end_year=args['end_year'],
-            export_data=args['o'],
-            export_stat=args['stat'],
-            export_schedule=args['ts'],
-            export_pickle=args['pickle'],
-            max_workers=args['w']
-        )
+        nfl = scraper_from_args(args)
         nfl.run()
-        nfl.export()
+        with nfl.metrics.stage('export', 'Done exporting'):
+            nfl.export()
+        if args['metrics']:
+            nfl.metrics.write(args['metrics'])
         timer.end_timer()
 
     except Exception as e:
-        print(e)
+        log.error(e)
+        if nfl is not None and os.path.exists(nfl.journal.path):
+            log.error('Pages parsed so far were saved, run again with -resume to continue')
         input()
-
+        sys.exit(1)